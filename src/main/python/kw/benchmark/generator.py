@@ -0,0 +1,248 @@
+import calendar
+import random
+
+from bson import Int64, ObjectId
+from datetime import datetime, timedelta
+
+FIRST_NAMES_EN = ['Somchai', 'Somsak', 'Suda', 'Malee', 'Anan', 'Kanya', 'Prasert', 'Wanida']
+LAST_NAMES_EN = ['Srisuk', 'Chaiyaporn', 'Thongdee', 'Boonmee', 'Saetang', 'Rattanakul']
+FIRST_NAMES_TH = ['สมชาย', 'สมศักดิ์', 'สุดา', 'มาลี', 'อนันต์', 'กัญญา']
+LAST_NAMES_TH = ['ศรีสุข', 'ชัยพร', 'ทองดี', 'บุญมี', 'แซ่ตั้ง']
+OCCUPATIONS = ['employee', 'business_owner', 'freelance', 'government_officer']
+BANKS = ['BBL', 'KBANK', 'KTB', 'SCB', 'BAY', 'TTB']
+SOURCES = ['application', 'bankruptcy', 'ncrs', 'tdg', 'true_analytics_score', 'tmn_score', 'wallet_blacklist']
+PRODUCTS = ['postpaid', 'prepaid', 'fixed_broadband', 'true_money', 'true_id']
+DECISIONS = ['APPROVE', 'REJECT', 'REVIEW']
+
+# Synthetic `decision` documents with every sub document and list the tables read.
+#
+#   fan_out     - the longest list generated, list lengths are uniform in 0..fan_out
+#   null_ratio  - the chance of an optional sub document or field being absent
+#
+# Documents are returned as pymongo decodes them (ObjectId, datetime, Int64), so they
+# go through the same conversion as production reads.
+class DocumentGenerator:
+  def __init__(self, seed: int=7, fan_out: int=3, null_ratio: float=0.1) -> None:
+    self.random = random.Random(seed)
+    self.fan_out = fan_out
+    self.null_ratio = null_ratio
+
+  def documents(self, count: int, start_datetime: datetime, end_datetime: datetime) -> list:
+    step = (end_datetime - start_datetime) / max(count, 1)
+    return [self.document(start_datetime + step * i) for i in range(count)]
+
+  def document(self, request_time: datetime) -> dict:
+    r = self.random
+    current_round_number = r.randint(1, 3)
+
+    decision_input_data = {
+      'current_round_number': Int64(current_round_number),
+      'sources': self.__list(lambda: {
+        'round': r.randint(1, current_round_number),
+        'source_name': r.sample(SOURCES, r.randint(1, 3)),
+        'status': r.choice(['SUCCESS', 'TIMEOUT', 'ERROR']),
+        'elapsed_ms': r.randint(5, 3000),
+      }),
+      'application': self.__optional(self.__application),
+      'bankruptcy': self.__optional(lambda: {
+        'is_bankrupt': r.random() < 0.02,
+        'checked_at': self.__timestamp(request_time),
+        'detail': {'case_no': self.__digits(8), 'court': r.choice(['CENTRAL', 'REGIONAL'])},
+      }),
+      'decision_output_data': self.__optional(lambda: self.__decision_output_data(request_time, datetime_field=False)),
+      'employee': self.__optional(lambda: {
+        'employee_id': self.__digits(6),
+        'is_employee': r.random() < 0.1,
+        'department': r.choice(['SALES', 'OPS', 'IT', None]),
+      }),
+      'existing_loan_accounts': self.__optional(lambda: {
+        'total_accounts': r.randint(0, self.fan_out),
+        'accounts': self.__list(lambda: {
+          'account_no': self.__digits(10),
+          'product': r.choice(['CARD', 'PLOAN', 'HOME']),
+          'outstanding': round(r.uniform(0, 500000), 2),
+          'dpd': Int64(r.choice([0, 0, 0, 30, 60, 90])),
+        }),
+      }),
+      'financial_profile': self.__optional(self.__financial_profile),
+      'financial_whitelist': self.__optional(lambda: {
+        'mobile': self.__mobile(),
+        'thai_id': self.__digits(13),
+        'is_whitelisted': r.random() < 0.3,
+      }),
+      'lending_blacklist': self.__optional(lambda: {
+        'is_blacklisted': r.random() < 0.05,
+        'blacklist': self.__list(lambda: {
+          '_id': self.__digits(13),
+          'reason': r.choice(['FRAUD', 'DEFAULT', 'COURT']),
+          'status': {'severity': r.randint(1, 5), 'updated_at': self.__timestamp(request_time)},
+          'mobile': {'number': self.__mobile(), 'creditLimit': r.choice([5000, 10000, 30000])},
+        }),
+      }),
+      'ncrs': self.__optional(lambda: {
+        'score': r.randint(300, 900),
+        'grade': r.choice(['AA', 'BB', 'CC', 'DD']),
+        'inquiry_count': r.randint(0, 12),
+      }),
+      'phone_metadata': self.__optional(lambda: {
+        'imei': self.__digits(15),
+        'model': r.choice(['SM-A525F', 'iPhone13,2', 'CPH2209', 'V2027']),
+        'os': {'name': r.choice(['android', 'ios']), 'version': '{0}.{1}'.format(r.randint(9, 17), r.randint(0, 4))},
+        'sim': [{'slot': i, 'carrier': r.choice(['TRUE', 'AIS', 'DTAC'])} for i in range(r.randint(1, 2))],
+      }),
+      'true_analytics_score': self.__optional(lambda: {
+        'total_product': Int64(r.randint(0, self.fan_out)),
+        'results': self.__list(self.__true_analytics_result),
+      }),
+      'tdg': self.__optional(lambda: {
+        'model_version': r.choice(['v1.2', 'v1.3']),
+        'results': self.__list(lambda: {
+          'segment': r.choice(['A', 'B', 'C']),
+          'total_score': r.randint(0, 1000),
+          'product_scores': self.__list(lambda: {
+            'product': r.choice(PRODUCTS),
+            'scores': {'score_100': r.randint(0, 100), 'grade': r.choice(['A', 'B', 'C', 'D'])},
+          }),
+        }),
+      }),
+      'tmn_score': self.__optional(lambda: {
+        'score': r.randint(0, 1000),
+        'model': r.choice(['tmn_v1', 'tmn_v2']),
+      }),
+      'wallet_blacklist': self.__optional(lambda: {
+        'is_blacklisted': r.random() < 0.05,
+        'wallet_blacklist': self.__list(lambda: {
+          'wallet_id': self.__digits(10),
+          'reason': r.choice(['FRAUD', 'CHARGEBACK']),
+        }),
+      }),
+    }
+
+    return {
+      '_id': self.__object_id(request_time),
+      'request_time': request_time,
+      'request_id': self.__digits(12),
+      'channel': r.choice(['APP', 'WEB', 'SHOP']),
+      'decision': r.choice(DECISIONS),
+      'decision_input_data': decision_input_data,
+      'decision_output_data': self.__optional(lambda: self.__decision_output_data(request_time, datetime_field=True)),
+    }
+
+  def __application(self) -> dict:
+    r = self.random
+    return {
+      'application_no': self.__digits(10),
+      'personal_info': {
+        'national_thai_id': self.__digits(13),
+        'first_name_en': r.choice(FIRST_NAMES_EN),
+        'last_name_en': r.choice(LAST_NAMES_EN),
+        'first_name_th': r.choice(FIRST_NAMES_TH),
+        'last_name_th': r.choice(LAST_NAMES_TH),
+        'mobile_number': self.__mobile(),
+        'contact_number': self.__optional(self.__mobile),
+        'email': '{0}{1}@example.com'.format(r.choice(FIRST_NAMES_EN).lower(), r.randint(1, 999)),
+        'birth_date': '19{0}-{1:02d}-{2:02d}'.format(r.randint(50, 99), r.randint(1, 12), r.randint(1, 28)),
+      },
+      'occupation_info': {
+        'occupation_id': r.randint(1, 40),
+        'occupation': r.choice(OCCUPATIONS),
+        'monthly_income': round(r.uniform(9000, 200000), 2),
+      },
+      'work_address': {
+        'office_phone_no': '02{0}'.format(self.__digits(7)),
+        'province': r.choice(['Bangkok', 'Chiang Mai', 'Khon Kaen', 'Phuket']),
+      },
+      'consent_list': self.__list(lambda: {
+        'consent_type': r.choice(['NCB', 'MARKETING', 'DATA_SHARING']),
+        'is_accepted': r.random() < 0.9,
+        'version': r.choice(['1.0', '1.1']),
+      }),
+      'financial_institution_list': self.__list(lambda: {
+        '_id': r.randint(1, 99),
+        'code': r.choice(BANKS),
+        'has_account': r.random() < 0.7,
+      }),
+      'questionnaire_list': self.__list(lambda: {
+        'quiz_id': r.randint(1, 20),
+        'answer_id': r.randint(1, 5),
+        'answer_text': r.choice(['yes', 'no', 'maybe']),
+      }),
+    }
+
+  def __decision_output_data(self, request_time: datetime, datetime_field: bool) -> dict:
+    r = self.random
+    output = {
+      'AGE_WHEN_APPLY': r.randint(20, 65),
+      'TRUE_RELATION_MONTH': r.randint(0, 240),
+      'WHITELIST_FLAG': r.randint(0, 1),
+      'TOTAL_BAD_BILL': r.randint(0, 6),
+      'CREDIT_LIMIT': float(r.choice([5000, 10000, 20000, 50000])),
+      'DECISION': r.choice(DECISIONS),
+    }
+    if datetime_field:
+      # decision_output_data.DATETIME is written in Bangkok time
+      output['AGE'] = output['AGE_WHEN_APPLY']
+      output['DATETIME'] = (request_time + timedelta(hours=7)).strftime('%Y-%m-%d %H:%M:%S')
+
+    return output
+
+  def __financial_profile(self) -> dict:
+    r = self.random
+    return {
+      'profile_type': r.choice(['SALARY', 'SELF_EMPLOYED']),
+      'profile': {
+        'income': {
+          'monthly_average': round(r.uniform(9000, 200000), 2),
+          'statement': {
+            'month_count': r.randint(3, 12),
+            'accounts': self.__list(lambda: {
+              'bank': r.choice(BANKS),
+              'account_no': self.__digits(10),
+              'balance': round(r.uniform(0, 1000000), 2),
+              'invoice': self.__list(lambda: {
+                'invoice_no': self.__digits(8),
+                'amount': round(r.uniform(100, 20000), 2),
+                'paid': r.random() < 0.8,
+              }),
+              'subscriber': self.__list(lambda: {
+                'subscriber_no': self.__mobile(),
+                'product': r.choice(PRODUCTS),
+              }),
+            }),
+          },
+        },
+      },
+    }
+
+  def __true_analytics_result(self) -> dict:
+    r = self.random
+    return {
+      'product': r.choice(PRODUCTS),
+      'scores': {'score_100': r.randint(0, 100), 'score_1000': r.randint(0, 1000)},
+      'score_variables': {
+        'max_delay_bill_amt_3_mth_all_1_day_delay_stats': r.randint(0, 5000),
+        'max_dpd_6_mth_all_1_day_delay_stats': r.randint(0, 120),
+        'cust_aging': r.randint(0, 240),
+        'delay_status_9_mth_all_30_day_delay_stats': r.randint(0, 9),
+      },
+    }
+
+  def __list(self, element) -> list:
+    return [element() for _ in range(self.random.randint(0, self.fan_out))]
+
+  def __optional(self, value):
+    return None if self.random.random() < self.null_ratio else value()
+
+  def __digits(self, length: int) -> str:
+    return ''.join(self.random.choice('0123456789') for _ in range(length))
+
+  def __mobile(self) -> str:
+    return '0{0}{1}'.format(self.random.choice('689'), self.__digits(8))
+
+  def __object_id(self, request_time: datetime) -> ObjectId:
+    # seeded rather than ObjectId(), so runs generate the same documents
+    seconds = calendar.timegm(request_time.timetuple())
+    return ObjectId(seconds.to_bytes(4, 'big') + self.random.getrandbits(64).to_bytes(8, 'big'))
+
+  def __timestamp(self, request_time: datetime) -> datetime:
+    return request_time - timedelta(days=self.random.randint(0, 365))
@@ -0,0 +1,118 @@
+import copy
+
+from datetime import datetime, timezone
+
+MISSING = object()
+
+def get_path(document: dict, path: str):
+  value = document
+  for segment in path.split('.'):
+    if not isinstance(value, dict) or segment not in value:
+      return MISSING
+    value = value[segment]
+
+  return value
+
+def comparable(value):
+  # pymongo hands back naive UTC datetimes and accepts aware ones in queries
+  if isinstance(value, datetime) and value.tzinfo is not None:
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+  return value
+
+OPERATORS = {
+  '$gt': lambda value, operand: value is not MISSING and comparable(value) > comparable(operand),
+  '$gte': lambda value, operand: value is not MISSING and comparable(value) >= comparable(operand),
+  '$lt': lambda value, operand: value is not MISSING and comparable(value) < comparable(operand),
+  '$lte': lambda value, operand: value is not MISSING and comparable(value) <= comparable(operand),
+  '$in': lambda value, operand: value is not MISSING and comparable(value) in [comparable(o) for o in operand],
+}
+
+# aggregation expressions of $expr conditions, '$path' strings refer to document fields
+EXPRESSIONS = {
+  '$toString': lambda value: str(value),
+  '$substrCP': lambda value, start, length: value[start:start + length],
+  '$in': lambda value, values: value in values,
+}
+
+def evaluate(document: dict, expression):
+  if isinstance(expression, str) and expression.startswith('$'):
+    return get_path(document, expression[1:])
+
+  if isinstance(expression, dict) and len(expression) == 1:
+    operator, operands = next(iter(expression.items()))
+    operands = operands if isinstance(operands, list) else [operands]
+    return EXPRESSIONS[operator](*[evaluate(document, operand) for operand in operands])
+
+  if isinstance(expression, list):
+    return [evaluate(document, item) for item in expression]
+
+  return expression
+
+def matches(document: dict, query: dict) -> bool:
+  for key, condition in query.items():
+    if key == '$and':
+      if not all(matches(document, sub_query) for sub_query in condition):
+        return False
+    elif key == '$or':
+      if not any(matches(document, sub_query) for sub_query in condition):
+        return False
+    elif key == '$expr':
+      if not evaluate(document, condition):
+        return False
+    elif isinstance(condition, dict) and condition and all(k.startswith('$') for k in condition):
+      value = get_path(document, key)
+      if not all(OPERATORS[operator](value, operand) for operator, operand in condition.items()):
+        return False
+    elif comparable(get_path(document, key)) != comparable(condition):
+      return False
+
+  return True
+
+def project(document: dict, projection: dict) -> dict:
+  projected = {'_id': document['_id']}
+  for path in projection:
+    value = get_path(document, path)
+    if value is MISSING:
+      continue
+
+    out = projected
+    segments = path.split('.')
+    for segment in segments[:-1]:
+      out = out.setdefault(segment, {})
+    out[segments[-1]] = value
+
+  return projected
+
+# An in-memory stand-in for the `decision` collection, supporting the queries Extractor sends.
+#
+# Every read returns deep copies, like documents freshly decoded from BSON.
+class LocalCollection:
+  def __init__(self, documents: list) -> None:
+    self.documents = documents
+
+  def find(self, query: dict=None, projection: dict=None, sort: list=None, **kwargs) -> 'LocalCursor':
+    documents = [document for document in self.documents if matches(document, query or {})]
+
+    # stable sorts applied from the last key to the first
+    for key, direction in reversed(sort or []):
+      documents.sort(key=lambda document: comparable(get_path(document, key)), reverse=direction < 0)
+
+    return LocalCursor(documents, projection)
+
+class LocalCursor:
+  def __init__(self, documents: list, projection: dict=None) -> None:
+    self.documents = iter(documents)
+    self.projection = projection
+
+  def batch_size(self, batch_size: int) -> 'LocalCursor':
+    return self
+
+  def __iter__(self) -> 'LocalCursor':
+    return self
+
+  def __next__(self) -> dict:
+    document = next(self.documents)
+    if self.projection:
+      document = project(document, self.projection)
+
+    return copy.deepcopy(document)
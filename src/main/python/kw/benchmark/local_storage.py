@@ -0,0 +1,59 @@
+import hashlib
+import os
+import shutil
+
+from kw.helper.misc import create_dir
+
+# Stand-in for GoogleCloudStorage that copies uploads under a local directory
+class LocalStorage:
+  def __init__(self, root: str) -> None:
+    self.root = root
+    self.uploaded_bytes = 0
+    self.uploaded_files = 0
+    self.skipped_files = 0
+
+  def upload(self, src: str, table: str='', sha256: str=None) -> None:
+    dst = os.path.join(self.root, src)
+    if sha256 is not None and self.__sha256(dst) == sha256:
+      self.skipped_files += 1
+      return
+
+    create_dir(os.path.dirname(dst))
+    shutil.copyfile(src, dst)
+
+    self.uploaded_bytes += os.path.getsize(dst)
+    self.uploaded_files += 1
+
+  def upload_async(self, src: str, table: str='', sha256: str=None) -> None:
+    self.upload(src, table, sha256)
+
+  def open(self, path: str):
+    dst = os.path.join(self.root, path)
+    create_dir(os.path.dirname(dst))
+    self.uploaded_files += 1
+
+    return open(dst, 'wb')
+
+  def download(self, path: str) -> bytes:
+    dst = os.path.join(self.root, path)
+    if not os.path.exists(dst):
+      return None
+
+    with open(dst, 'rb') as f:
+      return f.read()
+
+  def delete(self, path: str) -> None:
+    dst = os.path.join(self.root, path)
+    if os.path.exists(dst):
+      os.remove(dst)
+
+  def wait(self) -> None:
+    pass
+
+  # stands in for the sha256 metadata of the object, None when it does not exist
+  def __sha256(self, path: str) -> str:
+    if not os.path.exists(path):
+      return None
+
+    with open(path, 'rb') as f:
+      return hashlib.sha256(f.read()).hexdigest()
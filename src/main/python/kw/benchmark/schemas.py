@@ -0,0 +1,59 @@
+import copy
+import json
+import os
+import pandas as pd
+
+from kw.helper.misc import create_dir
+from kw.json.mongo_json_encoder import to_json_compatible
+from kw.service.etl.flattener import Flattener
+
+SCHEMA_TYPES = {
+  'integer': 'INTEGER',
+  'floating': 'FLOAT',
+  'mixed-integer-float': 'FLOAT',
+  'boolean': 'BOOLEAN',
+}
+
+def column_type(series: pd.Series) -> str:
+  schema_type = SCHEMA_TYPES.get(pd.api.types.infer_dtype(series, skipna=True), 'STRING')
+
+  # ints with gaps frame as float64, whole numbers throughout are taken for an integer field
+  if schema_type == 'FLOAT' and series.dropna().map(lambda value: float(value).is_integer()).all():
+    return 'INTEGER'
+
+  return schema_type
+
+# Writes a schema file for every spec from the columns the sample documents flatten to,
+# so the benchmark runs without the production schema directory.
+def write_schemas(specs: list, documents: list, root: str='.') -> None:
+  data_dicts = [to_json_compatible(copy.deepcopy(document)) for document in documents]
+
+  # frame the sample as is, the schema files do not exist yet
+  raw_specs = []
+  for spec in specs:
+    raw_spec = copy.copy(spec)
+    raw_spec.reindex = False
+    raw_specs.append(raw_spec)
+  frames = Flattener(raw_specs).flatten(data_dicts)
+
+  for spec in specs:
+    df = frames[spec.name]
+
+    columns = list(df.columns)
+    if not spec.record_path and spec.kind == 'obj':
+      # the root table keeps top-level fields, sub documents have tables of their own
+      columns = [column for column in columns if spec.separator not in column]
+    columns += [column for column in spec.hash_columns if column not in columns]
+
+    schema = []
+    for column in columns:
+      if column in spec.hash_columns or column not in df:
+        schema_type = 'STRING'
+      else:
+        schema_type = column_type(df[column])
+      schema.append({'name': column, 'type': schema_type, 'mode': 'NULLABLE'})
+
+    schema_file_path = os.path.join(root, spec.schema)
+    create_dir(os.path.dirname(schema_file_path))
+    with open(schema_file_path, 'w') as json_file:
+      json.dump(schema, json_file, indent=2)
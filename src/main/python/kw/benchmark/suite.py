@@ -0,0 +1,212 @@
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import pandas as pd
+
+from datetime import datetime, timezone
+from kw.benchmark.generator import DocumentGenerator
+from kw.benchmark.local_collection import LocalCollection
+from kw.benchmark.local_storage import LocalStorage
+from kw.benchmark.schemas import write_schemas
+from kw.service.etl.etl import ETL
+from kw.service.etl.extractor import Extractor
+from kw.service.etl.tables import TABLES, table_specs
+
+# modules timed by the startup stages, each imported in a fresh interpreter
+STARTUP_MODULES = {
+  'startup:kw.main': 'kw.main',
+  'startup:etl': 'kw.service.etl.etl',
+}
+
+# Runs the pipeline stage by stage over generated documents, with Mongo and GCS replaced by
+# in-process stand-ins, and records wall time, CPU time, rows and peak traced memory per stage.
+#
+# Stages run serially in a scratch directory so their numbers can be compared between versions.
+class Benchmark:
+  def __init__(
+      self, documents: int=10000, fan_out: int=3, seed: int=7,
+      schema_sample: int=1000, trace_memory: bool=True, startup_repeats: int=5,
+  ) -> None:
+    self.documents = documents
+    self.fan_out = fan_out
+    self.seed = seed
+    self.schema_sample = schema_sample
+    self.trace_memory = trace_memory
+    self.startup_repeats = startup_repeats
+    self.stages = []
+
+  def run(self, label: str='') -> dict:
+    start_datetime = datetime(2024, 1, 1)
+    end_datetime = datetime.combine(start_datetime.date(), datetime.max.time())
+    tables = list(TABLES)
+
+    for name, module in STARTUP_MODULES.items():
+      self.__startup(name, module)
+
+    work_dir = tempfile.mkdtemp(prefix='kw-benchmark-')
+    cwd = os.getcwd()
+    os.chdir(work_dir)
+
+    if self.trace_memory:
+      tracemalloc.start()
+
+    try:
+      # Extractor treats naive datetimes as local time and Mongo stores UTC
+      generator = DocumentGenerator(seed=self.seed, fan_out=self.fan_out)
+      documents = self.__stage(
+        'generate',
+        lambda: generator.documents(
+          self.documents, self.__utc(start_datetime), self.__utc(end_datetime),
+        ),
+        rows=len,
+      )
+      write_schemas(table_specs(tables), documents[:self.schema_sample])
+
+      storage = LocalStorage('uploaded')
+      extractor = Extractor(db_collection=LocalCollection(documents))
+      etl = self.__stage(
+        'extract',
+        lambda: ETL(
+          start_datetime, end_datetime, load_bucket='kw', tables=tables,
+          extractor=extractor, storage=storage,
+        ),
+        rows=lambda etl: len(etl.transformer.data_dicts),
+      )
+
+      self.__stage('transform', etl.frame_tables, rows=lambda _: sum(len(df.index) for df in etl.frames.values()))
+
+      load = self.__time_loads(etl.loader)
+      for table in tables:
+        table_rows = sum(len(etl.frames[spec.name].index) for spec in TABLES[table])
+        self.__stage(f'table:{table}', lambda: etl.load_table(table), rows=lambda _: table_rows)
+      self.stages.append(load)
+
+      self.__stage('close', etl.loader.close)
+      self.stages.append({
+        'stage': 'upload',
+        'files': storage.uploaded_files,
+        'skipped_files': storage.skipped_files,
+        'bytes': storage.uploaded_bytes,
+      })
+    finally:
+      if self.trace_memory:
+        tracemalloc.stop()
+      os.chdir(cwd)
+      shutil.rmtree(work_dir, ignore_errors=True)
+
+    return {
+      'label': label,
+      'created_at': datetime.now(timezone.utc).isoformat(),
+      'python': platform.python_version(),
+      'pandas': pd.__version__,
+      'documents': self.documents,
+      'fan_out': self.fan_out,
+      'seed': self.seed,
+      'max_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+      'stages': self.stages,
+    }
+
+  def __stage(self, name: str, fn, rows=None):
+    if self.trace_memory:
+      tracemalloc.reset_peak()
+
+    started = time.perf_counter()
+    cpu_started = time.process_time()
+    result = fn()
+    seconds = time.perf_counter() - started
+    cpu_seconds = time.process_time() - cpu_started
+
+    stage = {
+      'stage': name,
+      'seconds': round(seconds, 4),
+      'cpu_seconds': round(cpu_seconds, 4),
+    }
+    if rows is not None:
+      stage['rows'] = rows(result)
+      stage['rows_per_second'] = round(stage['rows'] / seconds, 1) if seconds > 0 else None
+    if self.trace_memory:
+      stage['peak_memory_mb'] = round(tracemalloc.get_traced_memory()[1] / 1024 / 1024, 2)
+
+    self.stages.append(stage)
+    print(' {0:<64} {1:>9.3f}s'.format(name, seconds))
+
+    return result
+
+  # best of startup_repeats cold imports, this interpreter has every module cached already
+  def __startup(self, name: str, module: str) -> None:
+    if self.startup_repeats <= 0:
+      return
+
+    python_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [python_root, os.getenv('PYTHONPATH')])))
+    code = 'import time; started = time.perf_counter(); import {0}; print(time.perf_counter() - started)'.format(module)
+
+    samples = []
+    for _ in range(self.startup_repeats):
+      completed = subprocess.run([sys.executable, '-c', code], env=env, capture_output=True, text=True, check=True)
+      samples.append(float(completed.stdout))
+
+    seconds = min(samples)
+    self.stages.append({'stage': name, 'seconds': round(seconds, 4)})
+    print(' {0:<64} {1:>9.3f}s'.format(name, seconds))
+
+  def __time_loads(self, loader) -> dict:
+    # Loader.load runs inside every table stage, its share is summed separately
+    load = {'stage': 'load', 'seconds': 0.0, 'rows': 0}
+    loader_load = loader.load
+
+    def timed_load(df, schema, table_name, deleted=None):
+      started = time.perf_counter()
+      loader_load(df, schema, table_name, deleted)
+      load['seconds'] = round(load['seconds'] + time.perf_counter() - started, 4)
+      load['rows'] += len(df.index)
+
+    loader.load = timed_load
+    return load
+
+  def __utc(self, dt: datetime) -> datetime:
+    return dt.astimezone(timezone.utc).replace(tzinfo=None)
+
+def compare(baseline: dict, current: dict) -> list:
+  baseline_stages = {stage['stage']: stage for stage in baseline['stages']}
+
+  lines = [' {0:<64} {1:>10} {2:>10} {3:>8}'.format('stage', 'baseline', 'current', 'speedup')]
+  for stage in current['stages']:
+    before = baseline_stages.get(stage['stage'])
+    if 'seconds' not in stage or before is None or not before.get('seconds'):
+      continue
+
+    speedup = before['seconds'] / stage['seconds'] if stage['seconds'] else float('inf')
+    lines.append(' {0:<64} {1:>9.3f}s {2:>9.3f}s {3:>7.2f}x'.format(
+      stage['stage'], before['seconds'], stage['seconds'], speedup,
+    ))
+
+  return lines
+
+def run() -> None:
+  benchmark = Benchmark(
+    documents=int(os.getenv('BENCHMARK_DOCUMENTS', '10000')),
+    fan_out=int(os.getenv('BENCHMARK_FAN_OUT', '3')),
+    seed=int(os.getenv('BENCHMARK_SEED', '7')),
+    trace_memory=os.getenv('BENCHMARK_TRACE_MEMORY', 'true').lower() in ['1', 'true', 'yes'],
+    startup_repeats=int(os.getenv('BENCHMARK_STARTUP_REPEATS', '5')),
+  )
+  results = benchmark.run(label=os.getenv('BENCHMARK_LABEL', ''))
+
+  output_path = os.getenv('BENCHMARK_OUTPUT', 'benchmark.json')
+  with open(output_path, 'w') as json_file:
+    json.dump(results, json_file, indent=2)
+  print(' Results written to {0}'.format(output_path))
+
+  baseline_path = os.getenv('BENCHMARK_BASELINE')
+  if baseline_path:
+    with open(baseline_path) as json_file:
+      baseline = json.load(json_file)
+    print('\n'.join(compare(baseline, results)))
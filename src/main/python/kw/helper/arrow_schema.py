@@ -0,0 +1,49 @@
+import json
+import pandas as pd
+import pyarrow as pa
+
+ARROW_TYPES = {
+  'STRING': pa.string(),
+  'INTEGER': pa.int64(),
+  'INT64': pa.int64(),
+  'FLOAT': pa.float64(),
+  'FLOAT64': pa.float64(),
+  'NUMERIC': pa.float64(),
+  'BOOLEAN': pa.bool_(),
+  'BOOL': pa.bool_(),
+  # the pipeline writes naive local timestamps, so no time zone is attached
+  'TIMESTAMP': pa.timestamp('us'),
+  'DATETIME': pa.timestamp('us'),
+  'DATE': pa.date32(),
+}
+
+def arrow_schema(schema_file_path: str) -> pa.Schema:
+  with open(schema_file_path) as json_file:
+    schema = json.load(json_file)
+
+  return pa.schema([
+    pa.field(obj['name'], ARROW_TYPES.get(str(obj.get('type', 'STRING')).upper(), pa.string()))
+    for obj in schema
+  ])
+
+def to_arrow_table(df: pd.DataFrame, schema: pa.Schema) -> pa.Table:
+  arrays = []
+  for field in schema:
+    if field.name not in df:
+      arrays.append(pa.nulls(len(df.index), field.type))
+      continue
+
+    column = df[field.name]
+    try:
+      array = pa.array(column, from_pandas=True)
+      if not array.type.equals(field.type):
+        array = array.cast(field.type)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+      if not pa.types.is_string(field.type):
+        raise
+      # nested values land in string columns the way to_csv would print them
+      array = pa.array(column.map(str, na_action='ignore'), type=field.type, from_pandas=True)
+
+    arrays.append(array)
+
+  return pa.Table.from_arrays(arrays, schema=schema)
@@ -0,0 +1,78 @@
+import gzip
+import hashlib
+import io
+
+COMPRESSION_EXTENSIONS = {
+  '': '',
+  'gzip': '.gz',
+  'zstd': '.zst',
+}
+
+class HashingWriter(io.RawIOBase):
+  def __init__(self, raw) -> None:
+    self.raw = raw
+    self.sha256 = hashlib.sha256()
+    self.bytes_written = 0
+
+  def writable(self) -> bool:
+    return True
+
+  def write(self, b) -> int:
+    self.sha256.update(b)
+    self.raw.write(b)
+    self.bytes_written += len(b)
+
+    return len(b)
+
+  def tell(self) -> int:
+    return self.bytes_written
+
+  def flush(self) -> None:
+    if not self.closed:
+      self.raw.flush()
+
+  def close(self) -> None:
+    if not self.closed:
+      super().close()
+      # sink streams take the digest along, to skip uploading content already stored
+      if hasattr(self.raw, 'digest'):
+        self.raw.digest = self.hexdigest()
+      self.raw.close()
+
+  def hexdigest(self) -> str:
+    return self.sha256.hexdigest()
+
+# Text stream that compresses and hashes in the same pass as it writes, the digest covers the stored bytes
+class HashingTextFile:
+  buffer_size = 1024 * 1024
+
+  def __init__(self, raw, compression: str='') -> None:
+    if compression not in COMPRESSION_EXTENSIONS:
+      raise ValueError('Unsupported compression: {0}'.format(compression))
+
+    self.hashing = HashingWriter(raw)
+    self.buffered = io.BufferedWriter(self.hashing, buffer_size=HashingTextFile.buffer_size)
+
+    if compression == 'gzip':
+      stream = gzip.GzipFile(fileobj=self.buffered, mode='wb', mtime=0)
+    elif compression == 'zstd':
+      import zstandard
+      stream = zstandard.ZstdCompressor().stream_writer(self.buffered)
+    else:
+      stream = self.buffered
+
+    self.text = io.TextIOWrapper(stream, encoding='utf-8', newline='')
+
+  def write(self, s: str) -> int:
+    return self.text.write(s)
+
+  def close(self) -> None:
+    self.text.close()
+    # GzipFile leaves its fileobj open
+    self.buffered.close()
+
+  def hexdigest(self) -> str:
+    return self.hashing.hexdigest()
+
+  def bytes_written(self) -> int:
+    return self.hashing.bytes_written
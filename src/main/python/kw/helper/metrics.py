@@ -0,0 +1,173 @@
+import json
+import os
+import resource
+import threading
+import time
+
+from contextlib import contextmanager
+
+PROMETHEUS_PREFIX = 'kw_etl'
+
+# name, help, record field, aggregation over the step's records
+PROMETHEUS_STEP_METRICS = [
+  ('step_seconds', 'Wall time spent in the step.', 'seconds', sum),
+  ('step_cpu_seconds', 'CPU time of the thread running the step.', 'cpu_seconds', sum),
+  ('step_rows', 'Rows handled by the step.', 'rows', sum),
+  ('step_bytes', 'Bytes written or uploaded by the step.', 'bytes', sum),
+  ('step_peak_rss_delta_bytes', 'Largest growth of the process peak RSS during the step.', 'peak_rss_delta_bytes', max),
+  ('step_count', 'Times the step ran.', None, len),
+]
+
+def max_rss_bytes() -> int:
+  # ru_maxrss is in kilobytes on Linux
+  return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def rss_bytes() -> int:
+  # current RSS from /proc on Linux, the peak where it is missing
+  try:
+    with open('/proc/self/statm') as f:
+      return int(f.read().split()[1]) * resource.getpagesize()
+  except OSError:
+    return max_rss_bytes()
+
+def prometheus_labels(labels: dict) -> str:
+  escaped = [
+    '{0}="{1}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+    for k, v in labels.items()
+  ]
+  return '{' + ','.join(escaped) + '}'
+
+def prometheus_gauge(name: str, help_text: str, values: list) -> list:
+  metric = f'{PROMETHEUS_PREFIX}_{name}'
+  return [f'# HELP {metric} {help_text}', f'# TYPE {metric} gauge'] + [
+    f'{metric}{prometheus_labels(labels)} {value}' for labels, value in values
+  ]
+
+# METRICS_PROM_PATH, or {root}_{slot}{ext} for a slot, e.g. metrics_shard0.prom
+def prometheus_file_path(slot: str=None) -> str:
+  prometheus_path = os.getenv('METRICS_PROM_PATH', 'metrics.prom')
+  if not prometheus_path or slot is None:
+    return prometheus_path
+
+  root, ext = os.path.splitext(prometheus_path)
+  return f'{root}_{slot}{ext}'
+
+def write_prometheus_file(path: str, text: str) -> None:
+  # written aside and renamed, the collector must never read a half written file;
+  # the tmp name is the process's own, parallel processes may export side by side
+  tmp_path = f'{path}.{os.getpid()}.tmp'
+  with open(tmp_path, 'w') as prometheus_file:
+    prometheus_file.write(text)
+  os.replace(tmp_path, path)
+
+# per-day gauges of a backfill, {day: (seconds, error)}, exported by its parent process to
+# {root}_backfill{ext}; the days' own runs write none
+def export_backfill(results: dict) -> None:
+  prometheus_path = prometheus_file_path('backfill')
+  if not prometheus_path:
+    return
+
+  days = [({'as_of': day.strftime('%Y%m%d')}, seconds, error) for day, (seconds, error) in sorted(results.items())]
+  lines = prometheus_gauge('backfill_day_seconds', 'Wall time of the backfill day.', [
+    (labels, seconds) for labels, seconds, _ in days
+  ])
+  lines += prometheus_gauge('backfill_day_success', '1 when the backfill day finished without errors.', [
+    (labels, int(error is None)) for labels, _, error in days
+  ])
+  lines += prometheus_gauge('backfill_timestamp_seconds', 'Unix time the backfill finished.', [({}, time.time())])
+
+  write_prometheus_file(prometheus_path, '\n'.join(lines) + '\n')
+
+# Wall time, CPU time, rows, bytes and peak RSS growth per pipeline step, exported at the
+# end of a run as JSON lines (one per step) and a Prometheus textfile-collector file.
+#
+# Each run replaces the Prometheus file of its slot (shard0 for shard 0, none for a plain
+# run), so gauges of earlier days do not linger; prometheus=False writes no file.
+#
+# Steps may be measured from any thread; CPU time is the measuring thread's own.
+class Metrics:
+  def __init__(self, labels: dict=None, slot: str=None, prometheus: bool=True) -> None:
+    self.labels = labels or {}
+    self.jsonl_path = os.getenv('METRICS_PATH', 'metrics.jsonl')
+    self.prometheus_path = prometheus_file_path(slot) if prometheus else ''
+
+    self.records = []
+    self.lock = threading.Lock()
+    self.started_at = time.time()
+    self.started = time.perf_counter()
+
+  @contextmanager
+  def measure(self, step: str, table: str=''):
+    record = {'step': step, 'table': table, 'rows': 0, 'bytes': 0, 'failed': False}
+
+    rss = max_rss_bytes()
+    started = time.perf_counter()
+    cpu_started = time.thread_time()
+    try:
+      yield record
+    except BaseException:
+      record['failed'] = True
+      raise
+    finally:
+      record['seconds'] = time.perf_counter() - started
+      record['cpu_seconds'] = time.thread_time() - cpu_started
+      record['peak_rss_delta_bytes'] = max_rss_bytes() - rss
+
+      with self.lock:
+        self.records.append(record)
+
+  def export(self, success: bool=True) -> None:
+    run_seconds = time.perf_counter() - self.started
+
+    if self.jsonl_path:
+      # one append per run, the lines of parallel runs do not interleave
+      with open(self.jsonl_path, 'a') as jsonl_file:
+        jsonl_file.write(''.join(
+          json.dumps({**self.labels, 'started_at': self.started_at, **record}) + '\n' for record in self.records
+        ))
+
+    if self.prometheus_path:
+      write_prometheus_file(self.prometheus_path, self.__prometheus(success, run_seconds))
+
+  def summary(self) -> str:
+    steps = {}
+    for record in self.records:
+      step = steps.setdefault(record['step'], {'count': 0, 'seconds': 0.0, 'rows': 0, 'bytes': 0})
+      step['count'] += 1
+      step['seconds'] += record['seconds']
+      step['rows'] += record['rows']
+      step['bytes'] += record['bytes']
+
+    lines = ['.----------.----------.----------.']
+    for name, step in steps.items():
+      lines.append(' {0:<10} {1:>5}x {2:>9.2f}s {3:>10} rows {4:>12} bytes'.format(
+        name, step['count'], step['seconds'], step['rows'], step['bytes'],
+      ))
+    lines.append('.----------.----------.----------.')
+
+    return '\n'.join(lines)
+
+  def __prometheus(self, success: bool, run_seconds: float) -> str:
+    groups = {}
+    for record in self.records:
+      groups.setdefault((record['step'], record['table']), []).append(record)
+
+    lines = []
+    for name, help_text, field, aggregate in PROMETHEUS_STEP_METRICS:
+      lines += prometheus_gauge(name, help_text, [
+        (
+          {**self.labels, 'step': step, 'table': table},
+          aggregate(records) if field is None else aggregate(record[field] for record in records),
+        )
+        for (step, table), records in groups.items()
+      ])
+
+    for name, help_text, value in [
+      ('run_seconds', 'Wall time of the whole run.', run_seconds),
+      ('run_success', '1 when the run finished without errors.', int(success)),
+      ('run_timestamp_seconds', 'Unix time the run started.', self.started_at),
+      ('peak_rss_bytes', 'Peak RSS of the process.', max_rss_bytes()),
+    ]:
+      lines += prometheus_gauge(name, help_text, [(self.labels, value)])
+
+    return '\n'.join(lines) + '\n'
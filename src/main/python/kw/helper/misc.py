@@ -9,5 +9,4 @@ def extract_schema_columns(schema_file_path: str) -> list:
     return list(map(lambda obj: obj['name'], schema))
 
 def create_dir(path: str):
-  if not os.path.exists(path):
-    os.makedirs(path)
+  os.makedirs(path, exist_ok=True)
@@ -0,0 +1,85 @@
+import json
+import os
+import pandas as pd
+
+from kw.json.mongo_json_encoder import TIMESTAMP_FORMAT
+
+INTEGER_TYPES = ['INTEGER', 'INT64']
+FLOAT_TYPES = ['FLOAT', 'FLOAT64', 'NUMERIC']
+BOOLEAN_TYPES = ['BOOLEAN', 'BOOL']
+TIMESTAMP_TYPES = ['TIMESTAMP', 'DATETIME']
+
+def schema_types(schema_file_path: str) -> dict:
+  with open(schema_file_path) as json_file:
+    schema = json.load(json_file)
+
+  return {obj['name']: str(obj.get('type', 'STRING')).upper() for obj in schema}
+
+# Casts framed columns to the types their schema file declares, in one pass per table:
+#
+#   INTEGER            -> nullable Int64
+#   FLOAT              -> float64
+#   BOOLEAN            -> nullable boolean
+#   TIMESTAMP/DATETIME -> datetime64, parsed from and written back as TIMESTAMP_FORMAT
+#   STRING             -> category when few distinct values repeat over many rows
+#
+# A column whose values do not fit its declared type is left as it was framed.
+class SchemaCaster:
+  def __init__(self) -> None:
+    self.category_ratio = float(os.getenv('CAST_CATEGORY_RATIO', '0.5'))
+    self.category_min_rows = int(os.getenv('CAST_CATEGORY_MIN_ROWS', '100'))
+
+  def cast(self, df: pd.DataFrame, types: dict) -> None:
+    if df.empty:
+      return
+
+    for column, schema_type in types.items():
+      if column not in df:
+        continue
+
+      try:
+        series = self.__cast_column(df[column], schema_type)
+      except (TypeError, ValueError, OverflowError):
+        continue
+
+      if series is not None:
+        df[column] = series
+
+  def __cast_column(self, series: pd.Series, schema_type: str) -> pd.Series:
+    if schema_type in INTEGER_TYPES:
+      if isinstance(series.dtype, pd.Int64Dtype):
+        return None
+      try:
+        return series.astype(pd.Int64Dtype())
+      except (TypeError, ValueError):
+        # numeric strings, parsed without coercing anything else to NaN
+        return pd.to_numeric(series).astype(pd.Int64Dtype())
+
+    if schema_type in FLOAT_TYPES:
+      if pd.api.types.is_float_dtype(series.dtype):
+        return None
+      return pd.to_numeric(series).astype('float64')
+
+    if schema_type in BOOLEAN_TYPES:
+      if isinstance(series.dtype, pd.BooleanDtype):
+        return None
+      return series.astype(pd.BooleanDtype())
+
+    if schema_type in TIMESTAMP_TYPES:
+      if pd.api.types.is_datetime64_any_dtype(series.dtype):
+        return None
+      return pd.to_datetime(series, format=TIMESTAMP_FORMAT)
+
+    return self.__to_category(series)
+
+  def __to_category(self, series: pd.Series) -> pd.Series:
+    if isinstance(series.dtype, pd.CategoricalDtype):
+      return None
+
+    count = series.count()
+    if count < self.category_min_rows or pd.api.types.infer_dtype(series, skipna=True) != 'string':
+      return None
+    if series.nunique() > count * self.category_ratio:
+      return None
+
+    return series.astype('category')
@@ -0,0 +1,72 @@
+import os
+import pandas as pd
+
+from kw.helper.hashing_writer import COMPRESSION_EXTENSIONS, HashingTextFile, HashingWriter
+from kw.json.mongo_json_encoder import TIMESTAMP_FORMAT
+
+PARQUET_COMPRESSION = {
+  '': 'snappy',
+  'gzip': 'gzip',
+  'zstd': 'zstd',
+}
+
+class CsvTableFile:
+  def __init__(self, raw, schema: str, compression: str='') -> None:
+    self.file = HashingTextFile(raw, compression)
+    self.header = True
+
+  @staticmethod
+  def extension(compression: str='') -> str:
+    return f'.csv{COMPRESSION_EXTENSIONS[compression]}'
+
+  def write(self, df: pd.DataFrame) -> None:
+    # timestamp columns are written back in the format they were extracted in
+    df.to_csv(self.file.text, header=self.header, index=False, date_format=TIMESTAMP_FORMAT)
+    self.header = False
+
+  def close(self) -> None:
+    self.file.close()
+
+  def hexdigest(self) -> str:
+    return self.file.hexdigest()
+
+  def bytes_written(self) -> int:
+    return self.file.bytes_written()
+
+class ParquetTableFile:
+  def __init__(self, raw, schema: str, compression: str='') -> None:
+    import pyarrow.parquet as pq
+    from kw.helper.arrow_schema import arrow_schema
+
+    self.hashing = HashingWriter(raw)
+    self.schema = arrow_schema(schema)
+    self.row_group_size = int(os.getenv('PARQUET_ROW_GROUP_SIZE', '131072'))
+    self.writer = pq.ParquetWriter(
+      self.hashing, self.schema,
+      compression=PARQUET_COMPRESSION[compression],
+      use_dictionary=True,
+    )
+
+  @staticmethod
+  def extension(compression: str='') -> str:
+    return '.parquet'
+
+  def write(self, df: pd.DataFrame) -> None:
+    from kw.helper.arrow_schema import to_arrow_table
+
+    self.writer.write_table(to_arrow_table(df, self.schema), row_group_size=self.row_group_size)
+
+  def close(self) -> None:
+    self.writer.close()
+    self.hashing.close()
+
+  def hexdigest(self) -> str:
+    return self.hashing.hexdigest()
+
+  def bytes_written(self) -> int:
+    return self.hashing.bytes_written
+
+TABLE_FILES = {
+  'csv': CsvTableFile,
+  'parquet': ParquetTableFile,
+}
@@ -3,10 +3,54 @@ import json
 from datetime import datetime
 from bson import ObjectId
 
+# datetimes are written as naive local time with microseconds
+TIMESTAMP_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+
 class MongoJSONEncoder(json.JSONEncoder):
   def default(self, obj):
     if isinstance(obj, ObjectId):
       return str(obj)
     if isinstance(obj, datetime):
-      return obj.astimezone().strftime("%Y-%m-%dT%H:%M:%S.%f")
+      return obj.astimezone().strftime(TIMESTAMP_FORMAT)
     return json.JSONEncoder.default(self, obj)
+
+# A value already serialized to JSON, framed as is
+class RawJSON(str):
+  pass
+
+# Replaces the subdocuments at paths (lists of keys) in a decoded BSON document with their JSON,
+# encoded from the BSON values in one pass; to_json_compatible leaves them alone afterwards
+def dump_paths(obj: dict, paths: list, encoder: MongoJSONEncoder=MongoJSONEncoder()) -> dict:
+  for path in paths:
+    parent = obj
+    for key in path[:-1]:
+      parent = parent.get(key) if isinstance(parent, dict) else None
+
+    if isinstance(parent, dict) and path[-1] in parent:
+      parent[path[-1]] = RawJSON(encoder.encode(parent[path[-1]]))
+
+  return obj
+
+# Converts a decoded BSON document in place to what a MongoJSONEncoder encode/json.loads round trip returns
+def to_json_compatible(obj, encoder: MongoJSONEncoder=MongoJSONEncoder()):
+  if isinstance(obj, dict):
+    for k, v in obj.items():
+      obj[k] = to_json_compatible(v, encoder)
+    return obj
+
+  if isinstance(obj, list):
+    for i, v in enumerate(obj):
+      obj[i] = to_json_compatible(v, encoder)
+    return obj
+
+  if obj is None or isinstance(obj, (str, bool, float)):
+    return obj
+
+  if isinstance(obj, int):
+    # bson.Int64 and friends come back as plain ints from json
+    return obj if type(obj) is int else int(obj)
+
+  if isinstance(obj, tuple):
+    return [to_json_compatible(v, encoder) for v in obj]
+
+  return encoder.default(obj)
@@ -1,8 +1,36 @@
 import os
+import multiprocessing
 import textwrap
+import time
 
-from datetime import datetime
-from kw.service.etl.etl import ETL
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timedelta
+
+TABLES = [
+  'application',
+  'bankruptcy',
+
+  'decision',
+  'decision_input_data_decision_output_data',
+  'decision_output_data',
+
+  'employee',
+  'existing_loan_accounts',
+
+  'financial_profile',
+  'financial_profile_profile_income_statements_accounts',
+  'financial_whitelist',
+
+  'lending_blacklist',
+  'ncrs',
+
+  'phone_metadata',
+
+  'ta_score',
+  'tdg',
+  'tmn_score',
+  'wallet_blacklist',
+]
 
 def start():
   start_datetime = datetime.combine(datetime.strptime(os.getenv('DATA_STARTED_DATE'), '%Y-%m-%d'), datetime.min.time())
@@ -22,29 +50,115 @@ def start():
 
   process(start_datetime, end_datetime)
 
-def process(start_datetime: datetime, end_datetime: datetime):
-  etl = ETL(start_datetime, end_datetime, load_bucket='kw')
+def backfill() -> int:
+  started_date = datetime.strptime(os.getenv('DATA_STARTED_DATE'), '%Y-%m-%d').date()
+  ended_date = datetime.strptime(os.getenv('DATA_ENDED_DATE'), '%Y-%m-%d').date()
+  workers = int(os.getenv('BACKFILL_WORKERS', '1'))
+
+  days = [started_date + timedelta(days=i) for i in range((ended_date - started_date).days + 1)]
+
+  welcome_message = '''
+  .==========.==========.==========.
+   START BACKFILL
+  .==========.==========.==========.
+   From:    {0}
+   To:      {1}
+   Days:    {2}
+   Workers: {3}
+  .----------.----------.----------.'''.format(started_date, ended_date, len(days), workers)
+
+  print(
+    textwrap.dedent(welcome_message)
+  )
+
+  # every day is its own ETL run, so each lands in its own {table}_{YYYYMMDD} partition
+  results = {}
+  if workers <= 1:
+    for day in days:
+      results[day] = process_day(day)
+  else:
+    # spawned workers build their own Mongo and GCS clients
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+      futures = {executor.submit(process_day, day): day for day in days}
+      for future in as_completed(futures):
+        results[futures[future]] = future.result()
 
-  etl.application()
-  etl.bankruptcy()
+  print('.==========.==========.==========.')
+  for day in days:
+    elapsed, error = results[day]
+    status = 'OK' if error is None else 'FAILED {0}'.format(error)
+    print(' {0} {1:>8.1f}s {2}'.format(day, elapsed, status))
+  print('.==========.==========.==========.')
 
-  etl.decision()
-  etl.decision_input_data_decision_output_data()
-  etl.decision_output_data()
+  from kw.helper.metrics import export_backfill
+  export_backfill(results)
 
-  etl.employee()
-  etl.existing_loan_accounts()
+  failed_days = [day for day in days if results[day][1] is not None]
+  if failed_days:
+    print(' {0} of {1} days failed'.format(len(failed_days), len(days)))
+    return 1
+
+  return 0
+
+# the day's run writes no Prometheus file, backfill() exports the days' gauges in one
+def process_day(day) -> tuple:
+  started = time.monotonic()
+  try:
+    process(datetime.combine(day, datetime.min.time()), datetime.combine(day, datetime.max.time()), prometheus=False)
+  except Exception as e:
+    return time.monotonic() - started, repr(e)
+
+  return time.monotonic() - started, None
+
+# the ETL modules (pandas, pymongo, the cloud SDKs) are imported by the functions that run it,
+# importing this module stays cheap for spawned workers and health checks
+def process(start_datetime: datetime, end_datetime: datetime, prometheus: bool=True):
+  from kw.service.etl.etl import ETL
+
+  batch_size = int(os.getenv('ETL_BATCH_SIZE', '0'))
+  workers = int(os.getenv('ETL_WORKERS', '1'))
+  incremental = os.getenv('EXTRACT_INCREMENTAL', 'false').lower() in ['1', 'true', 'yes']
+  # a node of a sharded run, run_merge publishes the manifests once every node is done
+  shard_count = int(os.getenv('SHARD_COUNT', '1'))
+  shard = (int(os.getenv('SHARD_INDEX', '0')), shard_count) if shard_count > 1 else None
+  etl = ETL(
+    start_datetime, end_datetime, load_bucket='kw',
+    tables=selected_tables(), batch_size=batch_size, workers=workers, incremental=incremental,
+    shard=shard, prometheus=prometheus,
+  )
+
+  etl.run()
+
+# coordinator of a sharded run: merges the SHARD_COUNT shard manifests of every selected
+# table into the manifest the warehouse reads
+def merge():
+  from kw.service.etl.loader import Loader
+  from kw.service.etl.tables import table_specs
+
+  as_of_datetime = datetime.strptime(os.getenv('DATA_STARTED_DATE'), '%Y-%m-%d')
+  shard_count = int(os.getenv('SHARD_COUNT', '1'))
+
+  welcome_message = '''
+  .==========.==========.==========.
+   MERGE SHARDS
+  .==========.==========.==========.
+   As of:  {0}
+   Shards: {1}
+  .----------.----------.----------.'''.format(as_of_datetime.date(), shard_count)
+
+  print(
+    textwrap.dedent(welcome_message)
+  )
 
-  etl.financial_profile()
-  etl.financial_profile_profile_income_statements_accounts()
-  etl.financial_whitelist()
+  loader = Loader(bucket='kw', as_of_datetime=as_of_datetime)
+  loader.merge_shards([spec.name for spec in table_specs(selected_tables())], shard_count)
 
-  etl.lending_blacklist()
-  etl.ncrs()
+def selected_tables() -> list:
+  from kw.service.etl.tables import TABLES as TABLE_GROUPS
 
-  etl.phone_metadata()
+  tables = [table.strip() for table in os.getenv('ETL_TABLES', '').split(',') if table.strip()]
+  unknown_tables = [table for table in tables if table not in TABLE_GROUPS]
+  if unknown_tables:
+    raise ValueError('Unknown ETL_TABLES: {0}'.format(', '.join(unknown_tables)))
 
-  etl.ta_score()
-  etl.tdg()
-  etl.tmn_score()
-  etl.wallet_blacklist()
+  return tables or TABLES
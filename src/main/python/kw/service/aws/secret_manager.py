@@ -1,25 +1,34 @@
-import boto3
 import base64
 import os
 import json
 
-from botocore.exceptions import ClientError
-
+# boto3 is imported and its client built on the first secrets() call, runs without
+# {aws_secret} values never load the AWS SDK
 class SecretManager:
   def __init__(self) -> None:
     self.secret_name = os.getenv('AWS_SECRET_ID')
     self.region_name = os.getenv('AWS_REGION')
 
-    self.session = boto3.session.Session()
-    self.client = self.session.client(service_name='secretsmanager', region_name=self.region_name)
-
+    self.__client = None
     self.secret_dict = None
 
+  @property
+  def client(self):
+    if self.__client is None:
+      import boto3
+
+      session = boto3.session.Session()
+      self.__client = session.client(service_name='secretsmanager', region_name=self.region_name)
+
+    return self.__client
+
   def secrets(self) -> dict:
     self.secret_dict = self.__get_secret_dict() if self.secret_dict is None else self.secret_dict
     return self.secret_dict
 
   def __get_secret_dict(self) -> dict:
+    from botocore.exceptions import ClientError
+
     try:
       response = self.client.get_secret_value(SecretId=self.secret_name)
     except ClientError as e:
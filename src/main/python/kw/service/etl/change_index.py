@@ -0,0 +1,170 @@
+import hashlib
+import sqlite3
+import threading
+import numpy as np
+import pandas as pd
+
+# Row-set digests of every table per document, kept in SQLite so a run loads only the rows
+# of documents that are new or changed.
+#
+# The tables of a group are compared together: a document changed in any of them is loaded
+# again in all of them, so the key_id/key_parent_id links between its rows stay consistent.
+# key_id counts rows over the whole frame, so it is compared relative to the document's first.
+#
+# diff() returns the rows to load and the keys (key_request_id, or key_parent_id for child
+# tables) whose earlier rows the warehouse deletes: those of changed documents and of
+# extracted documents left without rows. Digests are written by commit(), after the run's
+# files were uploaded.
+class ChangeIndex:
+  # SQLite allows at most 999 host parameters per statement on older builds
+  chunk_size = 900
+
+  def __init__(self, path: str) -> None:
+    # table groups are diffed from several scheduler threads
+    self.lock = threading.Lock()
+    self.connection = sqlite3.connect(path, check_same_thread=False)
+    self.connection.execute(
+      'CREATE TABLE IF NOT EXISTS digests ('
+      'table_name TEXT NOT NULL, request_id TEXT NOT NULL, digest TEXT NOT NULL, keys TEXT NOT NULL, '
+      'PRIMARY KEY (table_name, request_id))'
+    )
+
+    self.pending_digests = []
+    self.pending_deletes = []
+
+  def diff(self, specs: list, frames: dict, request_ids: list) -> dict:
+    documents = {spec.name: self.__documents(spec, frames[spec.name]) for spec in specs}
+    positions = {spec.name: group_positions(documents[spec.name]) for spec in specs}
+
+    # first key_id number of every document, per table numbering rows
+    bases = {
+      spec.name: key_numbers(frames[spec.name]['key_id']).groupby(documents[spec.name]).min()
+      for spec in specs if spec.row_id
+    }
+
+    digests = {}
+    stored = {}
+    changed = set()
+    for spec in specs:
+      digests[spec.name] = self.__digests(spec, frames[spec.name], documents[spec.name], positions[spec.name], bases)
+      stored[spec.name] = self.__select(spec.name, request_ids)
+
+      changed.update(
+        request_id for request_id, digest in digests[spec.name].items()
+        if stored[spec.name].get(request_id, (None,))[0] != digest
+      )
+      changed.update(request_id for request_id in stored[spec.name] if request_id not in digests[spec.name])
+
+    changes = {}
+    pending_digests = []
+    pending_deletes = []
+    for spec in specs:
+      df = frames[spec.name]
+      key_column = next(iter(spec.keys))
+      loaded = documents[spec.name].isin(changed)
+
+      key_values = df[key_column].to_numpy(dtype=object)
+
+      deleted_keys = []
+      for request_id in changed:
+        if request_id in stored[spec.name]:
+          deleted_keys.extend(stored[spec.name][request_id][1].split(' '))
+
+        if request_id in digests[spec.name]:
+          # the keys of the document's rows, deleted when it changes next
+          keys = ' '.join(dict.fromkeys(key_values[positions[spec.name][request_id]]))
+          pending_digests.append((spec.name, request_id, digests[spec.name][request_id], keys))
+        elif request_id in stored[spec.name]:
+          pending_deletes.append((spec.name, request_id))
+
+      changes[spec.name] = (df[loaded], pd.DataFrame({key_column: deleted_keys}))
+
+    with self.lock:
+      self.pending_digests.extend(pending_digests)
+      self.pending_deletes.extend(pending_deletes)
+
+    return changes
+
+  def commit(self) -> None:
+    with self.lock, self.connection:
+      self.connection.executemany('DELETE FROM digests WHERE table_name = ? AND request_id = ?', self.pending_deletes)
+      self.connection.executemany(
+        'INSERT OR REPLACE INTO digests (table_name, request_id, digest, keys) VALUES (?, ?, ?, ?)',
+        self.pending_digests,
+      )
+
+      self.pending_digests = []
+      self.pending_deletes = []
+
+  # decided by the spec's keys, a child table's schema may list key_request_id but it is left empty
+  def __documents(self, spec, df: pd.DataFrame) -> pd.Series:
+    if 'key_request_id' in spec.keys:
+      return df['key_request_id'].astype(object)
+
+    # child tables refer to their parent row's key_id, key_request_id + '_' + row number
+    return df[next(iter(spec.keys))].astype(object).str.rsplit('_', n=1).str[0]
+
+  def __digests(self, spec, df: pd.DataFrame, documents: pd.Series, positions: dict, bases: dict) -> dict:
+    if df.empty:
+      return {}
+
+    # hashes of the cast values, a category column hashes like its values
+    row_hashes = pd.util.hash_pandas_object(self.__hashable(spec, df, documents, bases), index=False).to_numpy()
+
+    return {
+      request_id: hashlib.blake2b(row_hashes[document_positions].tobytes(), digest_size=16).hexdigest()
+      for request_id, document_positions in positions.items()
+    }
+
+  # row numbers relative to the document's first, lists and dicts left in object columns,
+  # and mixed values, hashed by their str()
+  def __hashable(self, spec, df: pd.DataFrame, documents: pd.Series, bases: dict) -> pd.DataFrame:
+    columns = {}
+    for column in df.columns:
+      series = df[column]
+
+      if column == 'key_id' and spec.name in bases:
+        series = key_numbers(series) - documents.map(bases[spec.name])
+      elif column == 'key_parent_id' and 'key_parent_id' in spec.keys and spec.parent is not None and spec.parent.name in bases:
+        series = key_numbers(series) - documents.map(bases[spec.parent.name])
+      elif series.dtype == object and pd.api.types.infer_dtype(series, skipna=True) not in ['string', 'empty']:
+        series = series.map(str, na_action='ignore')
+
+      columns[column] = series
+
+    return pd.DataFrame(columns, index=df.index)
+
+  # {request_id: (digest, keys)} stored for the table
+  def __select(self, table_name: str, request_ids: list) -> dict:
+    rows = {}
+    with self.lock:
+      for i in range(0, len(request_ids), ChangeIndex.chunk_size):
+        chunk = request_ids[i:i + ChangeIndex.chunk_size]
+        placeholders = ','.join('?' * len(chunk))
+        for request_id, digest, keys in self.connection.execute(
+            f'SELECT request_id, digest, keys FROM digests WHERE table_name = ? AND request_id IN ({placeholders})',
+            [table_name] + chunk,
+        ):
+          rows[request_id] = (digest, keys)
+
+    return rows
+
+def key_numbers(keys: pd.Series) -> pd.Series:
+  return keys.astype(object).str.rsplit('_', n=1).str[1].astype('int64')
+
+# {request_id: row positions in frame order}, one sort instead of a groupby per document
+def group_positions(documents: pd.Series) -> dict:
+  if documents.empty:
+    return {}
+
+  codes, request_ids = pd.factorize(documents)
+  order = np.argsort(codes, kind='stable')
+
+  positions = {}
+  for document_positions in np.split(order, np.flatnonzero(np.diff(codes[order])) + 1):
+    # code -1 marks rows without a key
+    code = codes[document_positions[0]]
+    if code >= 0:
+      positions[request_ids[code]] = document_positions
+
+  return positions
@@ -0,0 +1,56 @@
+import fcntl
+import json
+import os
+
+from bson import ObjectId
+from datetime import datetime
+
+# High-water mark of the last successful run per as-of date, persisted as JSON, with the
+# last part written and the manifest counts of the parts so far. A shard of a sharded run
+# keeps its own state, under e.g. 20240101.shard0of4.
+#
+# Backfill days running in parallel processes share the file, so put() reads, updates and
+# replaces it holding an exclusive lock on {path}.lock.
+class Checkpoint:
+  def __init__(self, path: str) -> None:
+    self.path = path
+
+  def get(self, key: str) -> dict:
+    state = self.__read().get(key)
+    if state is None:
+      return None
+
+    return {
+      'watermark': (datetime.fromisoformat(state['request_time']), ObjectId(state['_id'])),
+      'part': state['part'],
+      # None for a state saved without them
+      'counts': state.get('counts'),
+    }
+
+  def put(self, key: str, watermark: tuple, part: int, counts: dict=None) -> None:
+    request_time, _id = watermark
+
+    with open(f'{self.path}.lock', 'a') as lock_file:
+      fcntl.flock(lock_file, fcntl.LOCK_EX)
+
+      states = self.__read()
+      states[key] = {
+        'request_time': request_time.isoformat(),
+        '_id': str(_id),
+        'part': part,
+      }
+      if counts is not None:
+        states[key]['counts'] = counts
+
+      # replace atomically so a failed write keeps the previous checkpoint
+      tmp_path = f'{self.path}.{os.getpid()}.tmp'
+      with open(tmp_path, 'w') as tmp_file:
+        json.dump(states, tmp_file, indent=2, sort_keys=True)
+      os.replace(tmp_path, self.path)
+
+  def __read(self) -> dict:
+    if not os.path.exists(self.path):
+      return {}
+
+    with open(self.path) as json_file:
+      return json.load(json_file)
@@ -1,446 +1,241 @@
+import os
 import pandas as pd
-import hashlib
-import json
 
 from datetime import datetime
-from kw.helper.misc import extract_schema_columns
+from functools import partial
+from kw.helper.metrics import Metrics, rss_bytes
+from kw.helper.schema_cast import SchemaCaster
+from kw.service.etl.change_index import ChangeIndex
+from kw.service.etl.checkpoint import Checkpoint
 from kw.service.etl.extractor import Extractor
+from kw.service.etl.flattener import Flattener
+from kw.service.etl.frame_spill import FrameSpill
+from kw.service.etl.hasher import Hasher
 from kw.service.etl.loader import Loader
+from kw.service.etl.scheduler import Scheduler
+from kw.service.etl.tables import TABLES, build_passthrough, build_projection, table_specs
 from kw.service.etl.transformer import Transformer
 
 class ETL:
-  def __init__(self, start_datetime: datetime, end_datetime: datetime, load_bucket: str) -> None:
-    extractor = Extractor()
-    data_dicts = extractor.extract_data_dicts(start_datetime, end_datetime)
-
-    self.transformer = Transformer(data_dicts)
-    self.loader = Loader(bucket=load_bucket, as_of_datetime=start_datetime)
-
-  def application(self) -> None:
-    _df = self.transformer.frame_obj(record_path=['decision_input_data', 'application'])
-
-    # application
-    #.----------.----------.----------.----------.----------.
-    app_table_name = 'application'
-    app_schema = 'schema/application/application_schema.json'
-    app_schema_cols = extract_schema_columns(app_schema)
-    app_df = _df.reindex(columns=app_schema_cols)
-
-    self.__hash(app_df, columns=[
-      'personal_info_national_thai_id',
-      'personal_info_first_name_en', 'personal_info_last_name_en',
-      'personal_info_first_name_th', 'personal_info_last_name_th',
-      'personal_info_mobile_number', 'personal_info_contact_number',
-      'personal_info_email', 'work_address_office_phone_no'
-    ])
-    self.__force_int(app_df, columns=['occupation_info_occupation_id'])
-
-    ## application_consent_list
-    #.----------.----------.----------.----------.----------.
-    consent_list_table_name = 'application_consent_list'
-    consent_list_schema = 'schema/application/application_consent_list_schema.json'
-    consent_list_df = self.transformer.frame_nested_list(
-      df=_df,
-      key='consent_list',
-      schema=consent_list_schema,
-    )
-
-    ## application_questionnaire_list
-    #.----------.----------.----------.----------.----------.
-    qtn_list_table_name = 'application_questionnaire_list'
-    qtn_list_schema = 'schema/application/application_questionnaire_list_schema.json'
-    qtn_list_df = self.transformer.frame_nested_list(
-      df=_df,
-      key='questionnaire_list',
-      schema=qtn_list_schema,
-    )
-
-    self.__force_int(qtn_list_df, columns=['quiz_id', 'answer_id'])
-
-    ## application_financial_institution_list
-    #.----------.----------.----------.----------.----------.
-    fin_inst_list_table_name = 'application_financial_institution_list'
-    fin_inst_list_schema = 'schema/application/application_financial_institution_list_schema.json'
-    fin_inst_list_df = self.transformer.frame_nested_list(
-      df=_df,
-      key='financial_institution_list',
-      schema=fin_inst_list_schema,
-    )
-
-    self.__force_int(fin_inst_list_df, columns=['_id'])
-
-    self.loader.load(app_df, app_schema, app_table_name)
-    self.loader.load(consent_list_df, consent_list_schema, consent_list_table_name)
-    self.loader.load(fin_inst_list_df, fin_inst_list_schema, fin_inst_list_table_name)
-    self.loader.load(qtn_list_df, qtn_list_schema, qtn_list_table_name)
-    self.__print_hr()
-
-  # bankruptcy
-  #.----------.----------.----------.----------.----------.
-  def bankruptcy(self) -> None:
-    table_name = 'bankruptcy'
-    schema = 'schema/bankruptcy/bankruptcy_schema.json'
-    schema_cols = extract_schema_columns(schema)
-    df = self.transformer.frame_obj(record_path=['decision_input_data', 'bankruptcy']).reindex(columns=schema_cols)
-
-    self.loader.load(df, schema, table_name)
-    self.__print_hr()
-
-  # decision
-  #.----------.----------.----------.----------.----------.
-  def decision(self) -> None:
-    table_name = 'decision'
-    schema='schema/decision/decision_schema.json'
-    schema_cols = extract_schema_columns(schema)
-    df = self.transformer.df.reindex(columns=schema_cols)
-
-    self.loader.load(df, schema, table_name)
-    self.__print_hr()
-
-  def decision_input_data(self) -> None:
-    _df = self.transformer.frame_obj(record_path=['decision_input_data'])
-
-    # decision_input_data
-    #.----------.----------.----------.----------.----------.
-    root_table_name = 'decision_input_data'
-    root_schema = 'schema/decision_input_data/decision_input_data_schema.json'
-    root_schema_cols = extract_schema_columns(root_schema)
-    root_df = _df.reindex(columns=root_schema_cols)
-
-    self.__force_int(root_df, columns=['current_round_number'])
-
-    # decision_input_data_sources
-    #.----------.----------.----------.----------.----------.
-    sources_table_name = 'decision_input_data_sources'
-    sources_schema = 'schema/decision_input_data/decision_input_data_sources_schema.json'
-    sources_df = self.transformer.frame_nested_list(
-      df=_df,
-      key='sources',
-      schema=sources_schema,
-    )
-    if not sources_df.empty:
-      sources_df['source_name'] = sources_df['source_name'].str.join('|')
-
-    self.__force_int(sources_df, columns=['round'])
-
-    self.loader.load(root_df, root_schema, root_table_name)
-    self.loader.load(sources_df, sources_schema, sources_table_name)
-    self.__print_hr()
-
-  #.decision_input_data_decision_output_data
-  #.----------.----------.----------.----------.----------.
-  def decision_input_data_decision_output_data(self) -> None:
-    table_name = 'decision_input_data_decision_output_data'
-    schema = 'schema/decision_input_data/decision_input_data_decision_output_data_schema.json'
-    schema_cols = extract_schema_columns(schema)
-    df = self.transformer.frame_obj(record_path=['decision_input_data', 'decision_output_data']).reindex(
-      columns=schema_cols,
-    )
-
-    self.__force_int(df, columns=['AGE_WHEN_APPLY', 'TRUE_RELATION_MONTH', 'WHITELIST_FLAG', 'TOTAL_BAD_BILL'])
-
-    self.loader.load(df, schema, table_name)
-    self.__print_hr()
-
-  # decision_output_data
-  #.----------.----------.----------.----------.----------.
-  def decision_output_data(self) -> None:
-    table_name = 'decision_output_data'
-    schema = 'schema/decision_output_data/decision_output_data_schema.json'
-    schema_cols = extract_schema_columns(schema)
-    df = self.transformer.frame_obj(record_path=['decision_output_data']).reindex(
-      columns=schema_cols,
-    )
-    df.DATETIME = pd.to_datetime(df.DATETIME) \
-      .dt.tz_localize('Asia/Bangkok') \
-      .dt.tz_convert('UTC') \
-      .dt.strftime('%Y-%m-%dT%H:%M:%S.%f')
-
-    self.__force_int(df, columns=['AGE', 'AGE_WHEN_APPLY', 'TRUE_RELATION_MONTH', 'WHITELIST_FLAG', 'TOTAL_BAD_BILL'])
-
-    self.loader.load(df, schema, table_name)
-    self.__print_hr()
-
-  # employee
-  #.----------.----------.----------.----------.----------.
-  def employee(self) -> None:
-    table_name = 'employee'
-    schema = 'schema/employee/employee_schema.json'
-    schema_cols = extract_schema_columns(schema)
-    df = self.transformer.frame_obj(record_path=['decision_input_data', 'employee']).reindex(
-      columns=schema_cols,
-    )
-
-    self.loader.load(df, schema, table_name)
-    self.__print_hr()
-
-  def existing_loan_accounts(self) -> None:
-    _df = self.transformer.frame_obj(record_path=['decision_input_data', 'existing_loan_accounts'])
-
-    # existing_loan_accounts
-    #.----------.----------.----------.----------.----------.
-    exg_loan_accs_table_name = 'existing_loan_accounts'
-    exg_loan_accs_schema = 'schema/existing_loan_accounts/existing_loan_accounts_schema.json'
-    exg_loan_accs_schema_cols = extract_schema_columns(exg_loan_accs_schema)
-    exg_loan_accs_df = _df.reindex(columns=exg_loan_accs_schema_cols)
-
-    # existing_loan_accounts_accounts
-    #.----------.----------.----------.----------.----------.
-    accs_list_table_name = 'existing_loan_accounts_accounts'
-    accs_list_schema = 'schema/existing_loan_accounts/existing_loan_accounts_accounts_schema.json'
-    accs_list_df = self.transformer.frame_nested_list(
-      df=_df,
-      key='accounts',
-      schema=accs_list_schema,
-    )
-
-    self.__force_int(accs_list_df, columns=['dpd'])
-
-    self.loader.load(exg_loan_accs_df, exg_loan_accs_schema, exg_loan_accs_table_name)
-    self.loader.load(accs_list_df, accs_list_schema, accs_list_table_name)
-    self.__print_hr()
-
-  # financial_profile
-  #.----------.----------.----------.----------.----------.
-  def financial_profile(self) -> None:
-    table_name = 'financial_profile'
-    schema = 'schema/financial_profile/financial_profile_schema.json'
-    schema_cols = extract_schema_columns(schema)
-
-    df = self.transformer.frame_obj(record_path=['decision_input_data', 'financial_profile']).reindex(
-      columns=schema_cols,
-    )
-    self.loader.load(df, schema, table_name)
-    self.__print_hr()
-
-  def financial_profile_profile_income_statements_accounts(self) -> None:
-    _df_stmt = self.transformer.frame_obj(
-      record_path=['decision_input_data', 'financial_profile', 'profile', 'income', 'statement']
-    )
-    _df_stmt_accts = self.transformer.frame_nested_list(df=_df_stmt, key='accounts')
-    _df_stmt_accts['key_id'] = _df_stmt_accts['key_request_id'] + '_' + _df_stmt_accts.index.astype(str)
-
-    ## financial_profile_profile_income_statement_accounts
-    #.----------.----------.----------.----------.----------.
-    accts_table_name = 'financial_profile_profile_income_statement_accounts'
-    accts_schema = 'schema/financial_profile/financial_profile_profile_income_statement_accounts_schema.json'
-    accts_schema_columns = extract_schema_columns(accts_schema)
-    accts_df = _df_stmt_accts.reindex(columns=accts_schema_columns)
-
-    _df_stmt_accts.rename(columns={'key_id': 'key_parent_id'}, inplace=True)
-
-    ## financial_profile_profile_income_statement_accounts_invoice
-    #.----------.----------.----------.----------.----------.
-    invoices_table_name = 'financial_profile_profile_income_statement_accounts_invoice'
-    invoices_schema = 'schema/financial_profile/financial_profile_profile_income_statement_accounts_invoice_schema.json'
-    invoices_df = self.transformer.frame_nested_list(
-      df=_df_stmt_accts,
-      schema=invoices_schema,
-      key='invoice',
-      additional_keys=['key_parent_id'],
-    )
-
-    ## financial_profile_profile_income_statement_accounts_subscriber
-    #.----------.----------.----------.----------.----------.
-    subscribers_table_name = 'financial_profile_profile_income_statement_accounts_subscriber'
-    subscribers_schema = 'schema/financial_profile/financial_profile_profile_income_statement_accounts_subscriber_schema.json'
-    subscribers_df = self.transformer.frame_nested_list(
-      df=_df_stmt_accts,
-      schema=subscribers_schema,
-      key='subscriber',
-      additional_keys=['key_parent_id'],
-    )
-
-    self.loader.load(accts_df, accts_schema, accts_table_name)
-    self.loader.load(invoices_df, invoices_schema, invoices_table_name)
-    self.loader.load(subscribers_df, subscribers_schema, subscribers_table_name)
-    self.__print_hr()
-
-  # financial_whitelist
-  #.----------.----------.----------.----------.----------.
-  def financial_whitelist(self) -> None:
-    table_name = 'financial_whitelist'
-    schema = 'schema/financial_whitelist/financial_whitelist_schema.json'
-    schema_cols = extract_schema_columns(schema)
-    df = self.transformer.frame_obj(
-      record_path=['decision_input_data', 'financial_whitelist'],
-    ).reindex(
-      columns=schema_cols,
-    )
+  def __init__(
+      self, start_datetime: datetime, end_datetime: datetime, load_bucket: str,
+      tables: list=None, batch_size: int=0, workers: int=1, incremental: bool=False,
+      extractor: Extractor=None, storage=None, shard: tuple=None, prometheus: bool=True,
+  ) -> None:
+    self.start_datetime = start_datetime
+    self.end_datetime = end_datetime
+    self.tables = list(TABLES) if tables is None else tables
+    self.batch_size = batch_size
+
+    self.as_of = start_datetime.strftime('%Y%m%d')
+
+    # shard is (index, count) when this run is one of several nodes, each extracting its
+    # share of the documents; Loader.merge_shards() publishes the manifests afterwards
+    self.shard = shard
+
+    # an incremental run extracts only documents after the last run's high-water mark;
+    # incremental and change capture runs write the parts numbered after the last run's,
+    # so a rerun of the day adds to its files and manifest instead of replacing them.
+    # Shards sharing EXTRACT_CHECKPOINT_PATH keep a state each
+    self.incremental = incremental
+    self.checkpoint_key = self.as_of if shard is None else '{0}.shard{1}of{2}'.format(self.as_of, *shard)
+    change_index_path = os.getenv('CDC_INDEX_PATH')
+    self.checkpoint = None
+    if incremental or change_index_path:
+      self.checkpoint = Checkpoint(os.getenv('EXTRACT_CHECKPOINT_PATH', 'checkpoint.json'))
+    state = self.checkpoint.get(self.checkpoint_key) if self.checkpoint is not None else None
+    self.after = state['watermark'] if state is not None and incremental else None
+    self.part = state['part'] + 1 if state is not None else 1
+    # manifest counts of the day's parts so far, see Loader
+    self.earlier_counts = state['counts'] if state is not None else {}
+
+    # a shard exports to a Prometheus file of its own, backfill days to none, see main.backfill
+    labels = {'as_of': self.as_of}
+    slot = None
+    if shard is not None:
+      labels['shard'] = shard[0]
+      slot = f'shard{shard[0]}'
+    self.metrics = Metrics(labels=labels, slot=slot, prometheus=prometheus)
+
+    # only the fields read by the selected tables come over the wire
+    self.projection = build_projection(self.tables) if tables is not None else None
+    # and subdocuments framed as JSON only are dumped once, from the BSON values
+    self.passthrough = build_passthrough(self.tables)
+
+    # every selected table is framed in one walk over the documents
+    self.flattener = Flattener(table_specs(self.tables))
+    self.frames = {}
+
+    # over ETL_MEMORY_BUDGET_MB the documents are released once walked and the tables framed
+    # while over it wait for their table group on disk, 0 keeps everything in memory
+    self.memory_budget = int(os.getenv('ETL_MEMORY_BUDGET_MB', '0')) * 1024 * 1024
+    self.spill = FrameSpill(os.getenv('ETL_SPILL_DIR') or None)
+
+    self.extractor = extractor if extractor is not None else Extractor()
+    self.transformer = None
+    if not batch_size:
+      with self.metrics.measure('extract') as record:
+        data_dicts = self.extractor.extract_data_dicts(
+          start_datetime, end_datetime, self.projection, self.after, self.passthrough, self.shard,
+        )
+        record['rows'] = len(data_dicts)
+      self.transformer = Transformer(data_dicts)
+
+    self.scheduler = Scheduler(workers)
+    self.hasher = Hasher()
+    self.caster = SchemaCaster()
+
+    # with a change index only rows of new or changed documents are loaded, plus a deletes file
+    self.changes = ChangeIndex(change_index_path) if change_index_path else None
+    self.request_ids = []
+
+    self.loader = Loader(
+      bucket=load_bucket, as_of_datetime=start_datetime, streaming=batch_size > 0, part=self.part,
+      storage=storage, metrics=self.metrics, shard=shard[0] if shard is not None else None,
+      earlier_counts=self.earlier_counts,
+    )
+
+  def run(self) -> None:
+    success = False
+    try:
+      self.__run()
+      success = True
+    except BaseException:
+      self.loader.abort()
+      raise
+    finally:
+      self.spill.close()
+      self.metrics.export(success)
+      print(self.metrics.summary())
+
+  def frame_tables(self) -> None:
+    with self.metrics.measure('normalize') as record:
+      states = self.flattener.walk(self.transformer.data_dicts)
+      if self.__over_memory_budget():
+        with self.metrics.measure('release') as release_record:
+          release_record['rows'] = len(self.transformer.data_dicts)
+          self.transformer.release()
+
+      # freed memory is seldom handed back to the OS, so once over the budget the frames
+      # framed next wait on disk
+      self.frames = {}
+      for name, df in self.flattener.frames(states):
+        record['rows'] += len(df.index)
+        if self.__over_memory_budget():
+          self.__spill(name, df)
+        else:
+          self.frames[name] = df
+
+  def load_table(self, table_name: str) -> None:
+    specs = TABLES[table_name]
+
+    frames = {}
+    for spec in specs:
+      df = self.__pop_frame(spec.name)
+
+      if spec.transform is not None:
+        with self.metrics.measure('transform', spec.name) as record:
+          spec.transform(df)
+          record['rows'] = len(df.index)
+
+      if spec.hash_columns and not df.empty:
+        with self.metrics.measure('hash', spec.name) as record:
+          self.__hash(df, columns=spec.hash_columns)
+          record['rows'] = len(df.index)
+
+      with self.metrics.measure('cast', spec.name) as record:
+        self.caster.cast(df, spec.schema_types)
+        record['rows'] = len(df.index)
+
+      frames[spec.name] = df
+
+    # the group's tables are compared together, see ChangeIndex
+    changes = None
+    if self.changes is not None:
+      with self.metrics.measure('cdc', table_name) as record:
+        changes = self.changes.diff(specs, frames, self.request_ids)
+        record['rows'] = sum(len(df.index) for df, _ in changes.values())
+
+    for spec in specs:
+      df = frames.pop(spec.name)
+      deleted = None
+      if changes is not None:
+        df, deleted = changes.pop(spec.name)
+
+      self.loader.load(df, spec.schema, spec.name, deleted)
+
+  def __run(self) -> None:
+    if not self.batch_size:
+      if self.incremental and not self.transformer.data_dicts:
+        print('No documents after the checkpoint, nothing to load')
+        return
+
+      self.__run_tables()
+
+      self.loader.close()
+      self.__save_checkpoint()
+      return
+
+    # stream documents through every table batch by batch, appending to the table files
+    data_dicts_batches = self.extractor.iter_data_dicts(
+      self.start_datetime, self.end_datetime, self.batch_size, self.projection, self.after, self.passthrough,
+      self.shard,
+    )
+    while True:
+      with self.metrics.measure('extract') as record:
+        data_dicts = next(data_dicts_batches, None)
+        record['rows'] = len(data_dicts or [])
+      if data_dicts is None:
+        break
+
+      # the transformer holds the batch's only reference, the memory budget may release it
+      self.transformer = Transformer(data_dicts)
+      data_dicts = None
+      self.__run_tables()
+
+    self.transformer = None
+    self.loader.close()
+    self.__save_checkpoint()
+
+  def __run_tables(self) -> None:
+    # documents of this run, the rows they no longer have are deleted
+    if self.changes is not None:
+      self.request_ids = [data_dict['_id'] for data_dict in self.transformer.data_dicts]
+
+    tasks = {'frame_tables': (self.frame_tables, [])}
+    for table in self.tables:
+      tasks[table] = (partial(self.load_table, table), ['frame_tables'])
+
+    self.scheduler.run(tasks)
+
+  def __over_memory_budget(self) -> bool:
+    return bool(self.memory_budget) and rss_bytes() > self.memory_budget
+
+  def __spill(self, name: str, df: pd.DataFrame) -> None:
+    with self.metrics.measure('spill', name) as record:
+      record['rows'] = len(df.index)
+      record['bytes'] = self.spill.put(name, df)
+
+  def __pop_frame(self, name: str) -> pd.DataFrame:
+    if name not in self.spill:
+      return self.frames.pop(name)
+
+    with self.metrics.measure('unspill', name) as record:
+      df = self.spill.pop(name)
+      record['rows'] = len(df.index)
+
+    return df
 
-    self.__hash(df, columns=['mobile', 'thai_id'])
-
-    self.loader.load(df, schema, table_name)
-    self.__print_hr()
-
-  def lending_blacklist(self) -> None:
-    _df = self.transformer.frame_obj(record_path=['decision_input_data', 'lending_blacklist'])
-
-    ## lending_blacklist
-    bl_table_name = 'lending_blacklist'
-    bl_schema = 'schema/lending_blacklist/lending_blacklist_schema.json'
-    bl_schema_cols = extract_schema_columns(bl_schema)
-    bl_df = _df.reindex(columns=bl_schema_cols)
-
-    ## lending_blacklist_blacklist
-    bl_bl_table_name = 'lending_blacklist_blacklist'
-    bl_bl_schema = 'schema/lending_blacklist/lending_blacklist_blacklist_schema.json'
-    bl_bl_df = self.transformer.frame_nested_list(df=_df, key='blacklist')
-
-    self.__hash(bl_bl_df, columns=['_id'])
-    self.__force_int(bl_bl_df, columns=['status_severity', 'mobile_creditLimit'])
-
-    self.loader.load(bl_df, bl_schema, bl_table_name)
-    self.loader.load(bl_bl_df, bl_bl_schema, bl_bl_table_name)
-    self.__print_hr()
-
-  # ncrs
-  #.----------.----------.----------.----------.----------.
-  def ncrs(self) -> None:
-    table_name = 'ncrs'
-    schema = 'schema/ncrs/ncrs_schema.json'
-    schema_cols = extract_schema_columns(schema)
-    df = self.transformer.frame_obj(record_path=['decision_input_data', 'ncrs']).reindex(columns=schema_cols)
-
-    self.loader.load(df, schema, table_name)
-    self.__print_hr()
-
-  # phone_metadata
-  #.----------.----------.----------.----------.----------.
-  def phone_metadata(self) -> None:
-    table_name = 'phone_metadata'
-    schema = 'schema/phone_metadata/phone_metadata_schema.json'
-    schema_cols = extract_schema_columns(schema)
-
-    df = pd.DataFrame(self.transformer.data_dicts)
-    if not df.empty:
-      df['key_request_id'] = df['_id']
-      df['phone_metadata'] = df['decision_input_data'].map(lambda i: json.dumps(i.get('phone_metadata')))
-      df = df[['key_request_id', 'phone_metadata']].reindex(columns=schema_cols)
-
-    self.loader.load(df, schema, table_name)
-    self.__print_hr()
-
-  def ta_score(self) -> None:
-    _df = self.transformer.frame_obj(record_path=['decision_input_data', 'true_analytics_score'])
-
-    # ta_score
-    #.----------.----------.----------.----------.----------.
-    ta_score_table_name = 'true_analytics_score'
-    ta_score_schema = 'schema/ta_score/ta_score_schema.json'
-    ta_score_schema_cols = extract_schema_columns(ta_score_schema)
-    ta_score_df = _df.reindex(columns=ta_score_schema_cols)
-
-    self.__force_int(ta_score_df, columns=['total_product'])
-
-    ## ta_score_result
-    #.----------.----------.----------.----------.----------.
-    ta_score_results_table_name = 'true_analytics_score_result'
-    ta_score_results_schema = 'schema/ta_score/ta_score_result_schema.json'
-    ta_score_results_df = self.transformer.frame_nested_list(
-      df=_df,
-      key='results',
-      schema=ta_score_results_schema,
-    )
-
-    self.__force_int(ta_score_results_df, columns=[
-      'scores_score_100',
-      'score_variables_max_delay_bill_amt_3_mth_all_1_day_delay_stats',
-      'score_variables_max_dpd_6_mth_all_1_day_delay_stats',
-      'score_variables_cust_aging',
-      'score_variables_delay_status_9_mth_all_30_day_delay_stats'
-    ])
-
-    self.loader.load(ta_score_df, ta_score_schema, ta_score_table_name)
-    self.loader.load(ta_score_results_df, ta_score_results_schema, ta_score_results_table_name)
-    self.__print_hr()
-
-  def tdg(self) -> None:
-    _df = self.transformer.frame_obj(record_path=['decision_input_data', 'tdg'])
-    _df_results = self.transformer.frame_nested_list(df=_df, key='results')
-    _df_results['key_id'] = _df_results['key_request_id'] + '_' + _df_results.index.astype(str)
-
-    # tdg
-    #.----------.----------.----------.----------.----------.
-    tdg_table_name = 'tdg'
-    tdg_schema = 'schema/tdg/tdg_schema.json'
-    tdg_schema_cols = extract_schema_columns(tdg_schema)
-    tdg_df = _df.reindex(columns=tdg_schema_cols)
-
-    ## tdg_results
-    #.----------.----------.----------.----------.----------.
-    results_table_name = 'tdg_results'
-    results_schema = 'schema/tdg/tdg_results_schema.json'
-    results_schema_cols = extract_schema_columns(results_schema)
-    results_df = _df_results.reindex(columns=results_schema_cols)
-
-    self.__force_int(results_df, columns=['total_score'])
-
-    ## tdg_results_product_scores
-    #.----------.----------.----------.----------.----------.
-    _df_results.rename(columns={'key_id': 'key_parent_id'}, inplace=True)
-    product_scores_table_name = 'tdg_results_product_scores'
-    product_scores_schema = 'schema/tdg/tdg_results_product_scores_schema.json'
-    product_scores_df = self.transformer.frame_nested_list(
-      df=_df_results,
-      key='product_scores',
-      additional_keys=['key_parent_id'],
-      schema=product_scores_schema,
-    )
-
-    self.__force_int(product_scores_df, columns=['scores_score_100'])
-
-    self.loader.load(tdg_df, tdg_schema, tdg_table_name)
-    self.loader.load(results_df, results_schema, results_table_name)
-    self.loader.load(product_scores_df, product_scores_schema, product_scores_table_name)
-    self.__print_hr()
-
-  # tmn_score
-  #.----------.----------.----------.----------.----------.
-  def tmn_score(self) -> None:
-    table_name = 'tmn_score'
-    schema = 'schema/tmn_score/tmn_score_schema.json'
-    schema_cols = extract_schema_columns(schema)
-
-    df = self.transformer.frame_obj(
-      record_path=['decision_input_data', 'tmn_score'],
-    ).reindex(
-      columns=schema_cols,
-    )
-
-    self.loader.load(df, schema, table_name)
-    self.__print_hr()
-
-  def wallet_blacklist(self) -> None:
-    _df = self.transformer.frame_obj(record_path=['decision_input_data', 'wallet_blacklist'])
-
-    ## wallet_blacklist
-    #.----------.----------.----------.----------.----------.
-    wbl_table_name = 'wallet_blacklist'
-    wbl_schema = 'schema/wallet_blacklist/wallet_blacklist_schema.json'
-    wbl_schema_cols = extract_schema_columns(wbl_schema)
-    wbl_df = _df.reindex(columns=wbl_schema_cols)
-
-    ## wallet_blacklist_wallet_blacklist
-    #.----------.----------.----------.----------.----------.
-    wbl_wbl_table_name = 'wallet_blacklist_wallet_blacklist'
-    wbl_wbl_schema = 'schema/wallet_blacklist/wallet_blacklist_wallet_blacklist_schema.json'
-    wbl_wbl_df = self.transformer.frame_nested_list(df=_df, key='wallet_blacklist')
-
-    self.loader.load(wbl_df, wbl_schema, wbl_table_name)
-    self.loader.load(wbl_wbl_df, wbl_wbl_schema, wbl_wbl_table_name)
-    self.__print_hr()
-
-  def __force_int(self, df: pd.DataFrame, columns: list) -> None:
-    if not df.empty:
-      df[columns] = df[columns].astype(pd.Int64Dtype())
+  def __save_checkpoint(self) -> None:
+    # saved only after every upload succeeded, a failed run is re-extracted next time
+    if self.changes is not None:
+      self.changes.commit()
+
+    if self.checkpoint is not None and self.extractor.watermark is not None:
+      counts = {**(self.earlier_counts or {}), **self.loader.counts}
+      self.checkpoint.put(self.checkpoint_key, self.extractor.watermark, self.loader.last_part, counts)
 
   def __hash(self, df: pd.DataFrame, columns: list) -> None:
     if not df.empty:
-      df[columns] = df[columns].applymap(self.__sha256)
-
-  def __sha256(self, s) -> str:
-    return hashlib.sha256(str(s).encode('utf-8')).hexdigest() if not pd.isna(s) else ''
-
-  def __print_hr(self) -> None:
-    print('.----------.----------.----------.')
+      for column in columns:
+        df[column] = self.hasher.hash(df[column])
@@ -1,34 +1,157 @@
 import os
-import json
+import itertools
+import multiprocessing
 import pytz
 
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
-from pymongo import MongoClient
-from kw.json.mongo_json_encoder import MongoJSONEncoder
+from kw.json.mongo_json_encoder import dump_paths, to_json_compatible
 from kw.service.aws.secret_manager import SecretManager
 
 class Extractor:
-  def __init__(self) -> None:
+  # a stable order lets time shards be concatenated into exactly the serial result
+  # (pymongo is imported only where a client is opened, 1 is pymongo.ASCENDING)
+  sort = [('request_time', 1), ('_id', 1)]
+
+  def __init__(self, db_collection=None) -> None:
+    # (request_time, _id) of the last document extracted
+    self.watermark = None
+
+    # a stand-in collection (e.g. the benchmark's) is read in process
+    if db_collection is not None:
+      self.db_client_kwargs = None
+      self.db_collection = db_collection
+      self.workers = 1
+      return
+
     self.secret_manager = SecretManager()
 
-    db_uri = os.getenv('DB_URI')
-    db_username = self.__get_secret(key='DB_USERNAME')
-    db_password = self.__get_secret(key='DB_PASSWORD')
-    db_client = MongoClient(host = db_uri, username = db_username, password = db_password)
+    self.db_client_kwargs = {
+      'host': os.getenv('DB_URI'),
+      'username': self.__get_secret(key='DB_USERNAME'),
+      'password': self.__get_secret(key='DB_PASSWORD'),
+    }
+    from pymongo import MongoClient
+
+    db_client = MongoClient(**self.db_client_kwargs)
 
     self.db_collection = db_client['kw']['decision']
+    self.workers = int(os.getenv('EXTRACT_WORKERS', '1'))
 
-  def extract_data_dicts(self, start_datetime, end_datetime):
-    query_string = {
-      '$and': [
-        {'request_time': {'$gte': start_datetime.astimezone(pytz.utc)}},
-        {'request_time': {'$lte': end_datetime.astimezone(pytz.utc)}}
-      ]
-    }
+  # passthrough lists subdocument paths kept as their JSON, see build_passthrough;
+  # shard is (index, count) when the run is one of several nodes, see shard_condition
+  def extract_data_dicts(
+      self, start_datetime, end_datetime, projection: dict=None, after: tuple=None, passthrough: list=None,
+      shard: tuple=None,
+  ):
+    if self.workers > 1:
+      return self.__extract_shards(start_datetime, end_datetime, projection, after, passthrough, shard)
+
+    data_cursor = self.__find(start_datetime, end_datetime, projection, after, shard)
+    data_dicts, watermark = to_data_dicts(data_cursor, passthrough)
+    self.__advance(watermark)
+
+    return data_dicts
+
+  def iter_data_dicts(
+      self, start_datetime, end_datetime, batch_size: int, projection: dict=None, after: tuple=None,
+      passthrough: list=None, shard: tuple=None,
+  ):
+    data_cursor = self.__find(start_datetime, end_datetime, projection, after, shard).batch_size(batch_size)
+
+    while True:
+      data_dicts, watermark = to_data_dicts(itertools.islice(data_cursor, batch_size), passthrough)
+      if not data_dicts:
+        break
+
+      self.__advance(watermark)
+      yield data_dicts
+
+  def __extract_shards(
+      self, start_datetime, end_datetime, projection: dict=None, after: tuple=None, passthrough: list=None,
+      shard: tuple=None,
+  ) -> list:
+    start_utc = start_datetime.astimezone(pytz.utc)
+    end_utc = end_datetime.astimezone(pytz.utc)
+    step = (end_utc - start_utc) / self.workers
+
+    bounds = [start_utc + step * i for i in range(self.workers)] + [end_utc]
+    query_strings = [
+      Extractor.query_string(bounds[i], bounds[i + 1], end_inclusive=(i == self.workers - 1), after=after, shard=shard)
+      for i in range(self.workers)
+    ]
+
+    # spawned workers open their own MongoClient, the parent's client is not fork-safe
+    with ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+      shards = executor.map(
+        find_data_dicts,
+        itertools.repeat(self.db_client_kwargs),
+        query_strings,
+        itertools.repeat(self.__with_sort_keys(projection)),
+        itertools.repeat(passthrough),
+      )
+
+      data_dicts = []
+      for shard, watermark in shards:
+        data_dicts.extend(shard)
+        self.__advance(watermark)
+
+      return data_dicts
 
-    data_cursor = self.db_collection.find(query_string)
+  def __find(self, start_datetime, end_datetime, projection: dict=None, after: tuple=None, shard: tuple=None):
+    query_string = Extractor.query_string(start_datetime, end_datetime, after=after, shard=shard)
 
-    return json.loads(MongoJSONEncoder().encode(list(data_cursor)))
+    return Extractor.find(self.db_collection, query_string, self.__with_sort_keys(projection))
+
+  def __advance(self, watermark: tuple) -> None:
+    # shards and batches arrive in sort order, so the last one seen is the highest
+    if watermark is not None:
+      self.watermark = watermark
+
+  def __with_sort_keys(self, projection: dict=None) -> dict:
+    # the watermark is read from the sort keys, _id is always returned
+    if projection is None or 'request_time' in projection:
+      return projection
+
+    return {**projection, 'request_time': 1}
+
+  @staticmethod
+  def query_string(
+      start_datetime, end_datetime, end_inclusive: bool=True, after: tuple=None, shard: tuple=None,
+  ) -> dict:
+    conditions = [
+      {'request_time': {'$gte': start_datetime.astimezone(pytz.utc)}},
+      {'request_time': {'$lte' if end_inclusive else '$lt': end_datetime.astimezone(pytz.utc)}}
+    ]
+
+    # only documents sorting after the (request_time, _id) high-water mark
+    if after is not None:
+      request_time, _id = after
+      conditions.append({
+        '$or': [
+          {'request_time': {'$gt': request_time}},
+          {'request_time': request_time, '_id': {'$gt': _id}},
+        ]
+      })
+
+    if shard is not None:
+      conditions.append(Extractor.shard_condition(*shard))
+
+    return {'$and': conditions}
+
+  # documents whose _id ends in one of the shard's byte values, the trailing counter byte
+  # spreads them evenly; index in [0, count), at most 256 shards
+  @staticmethod
+  def shard_condition(index: int, count: int) -> dict:
+    if not 0 <= index < count <= 256:
+      raise ValueError('Invalid shard {0} of {1}'.format(index, count))
+
+    last_bytes = ['{0:02x}'.format(value) for value in range(256) if value % count == index]
+    return {'$expr': {'$in': [{'$substrCP': [{'$toString': '$_id'}, 22, 2]}, last_bytes]}}
+
+  @staticmethod
+  def find(db_collection, query_string: dict, projection: dict=None):
+    return db_collection.find(query_string, projection or None, sort=Extractor.sort, allow_disk_use=True)
 
   def __get_secret(self, key: str):
     secret_indicator = '{aws_secret}'
@@ -40,3 +163,26 @@ class Extractor:
        return secrets[v]
     else:
        return v
+
+def to_data_dicts(data_cursor, passthrough: list=None) -> tuple:
+  data_dicts = []
+  watermark = None
+
+  for data_dict in data_cursor:
+    # read before conversion, the sort keys are compared as raw BSON values
+    watermark = (data_dict.get('request_time'), data_dict.get('_id'))
+    if passthrough:
+      dump_paths(data_dict, passthrough)
+    data_dicts.append(to_json_compatible(data_dict))
+
+  return data_dicts, watermark
+
+def find_data_dicts(db_client_kwargs: dict, query_string: dict, projection: dict=None, passthrough: list=None) -> tuple:
+  from pymongo import MongoClient
+
+  db_client = MongoClient(**db_client_kwargs)
+  try:
+    data_cursor = Extractor.find(db_client['kw']['decision'], query_string, projection)
+    return to_data_dicts(data_cursor, passthrough)
+  finally:
+    db_client.close()
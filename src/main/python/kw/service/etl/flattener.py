@@ -0,0 +1,183 @@
+import collections
+import json
+import pandas as pd
+
+from kw.json.mongo_json_encoder import RawJSON
+from kw.service.etl.table_spec import TableSpec
+
+# the elements of a missing or empty list, a placeholder row of keys only
+NO_ELEMENTS = (None,)
+
+def flatten_record(record: dict, separator: str, prefix: str='', out: dict=None) -> dict:
+  # same keys and values as a pd.json_normalize row, lists are kept as values
+  out = {} if out is None else out
+  for k, v in record.items():
+    key = f'{prefix}{separator}{k}' if prefix else str(k)
+    if isinstance(v, dict):
+      flatten_record(v, separator, key, out)
+    else:
+      out[key] = v
+
+  return out
+
+def get_record(data_dict: dict, record_path: list):
+  record = data_dict
+  for segment in record_path:
+    if not isinstance(record, dict):
+      return None
+    record = record.get(segment)
+
+  return record
+
+# Compiles table specs into a tree of record nodes and frames every table in one walk over the documents.
+#
+# A list node keeps a placeholder row (keys only) for every parent row without elements and numbers
+# rows across all documents, which is what exploding the flattened frame with pandas produced.
+# The numbering goes on over the walks of a run, so key_id does not depend on ETL_BATCH_SIZE.
+class Flattener:
+  def __init__(self, specs: list) -> None:
+    self.specs = specs
+    self.nodes = {}
+    self.spec_nodes = {spec.name: self.__node(spec) for spec in specs}
+
+    for spec in specs:
+      if spec.kind == 'obj':
+        self.nodes[self.spec_nodes[spec.name]]['flatten'] = True
+
+    # rows framed by the earlier walks, key_id numbers continue after them
+    self.row_offsets = {node_key: 0 for node_key in self.nodes}
+
+    # list nodes keep their (element, row) entries only for the list nodes below them
+    for node in self.nodes.values():
+      if node['kind'] == 'list':
+        self.nodes[node['parent']]['has_lists'] = True
+
+  def flatten(self, data_dicts: list) -> dict:
+    return dict(self.frames(self.walk(data_dicts)))
+
+  # rows of every node, the documents are not read again afterwards
+  def walk(self, data_dicts: list) -> dict:
+    states = {
+      node_key: {'rows': [], 'has_element': False, 'row_offset': self.row_offsets[node_key]}
+      for node_key in self.nodes
+    }
+
+    for data_dict in data_dicts:
+      key_request_id = data_dict.get('_id')
+      # the parent row of every record node of the document
+      document_row = {'key_request_id': key_request_id}
+      entries = {}
+
+      # nodes are ordered parents first
+      for node_key, node in self.nodes.items():
+        state = states[node_key]
+
+        if node['kind'] == 'obj':
+          record = get_record(data_dict, node['record_path'])
+          entries[node_key] = ((record, document_row),)
+
+          if node['flatten']:
+            row = flatten_record(record, node['separator']) if isinstance(record, dict) else {}
+            row['key_request_id'] = key_request_id
+            state['rows'].append(row)
+
+        elif node['kind'] == 'json':
+          record = get_record(data_dict, node['record_path'])
+          value = record.get(node['json_key']) if isinstance(record, dict) else None
+          # dumped by the extractor already when the subdocument was passed through
+          value = str(value) if isinstance(value, RawJSON) else json.dumps(value)
+          state['rows'].append({'key_request_id': key_request_id, node['json_key']: value})
+
+        else:
+          entries[node_key] = self.__list_entries(node, state, entries[node['parent']])
+
+    for node_key, state in states.items():
+      self.row_offsets[node_key] += len(state['rows'])
+
+    return states
+
+  # (table name, frame) in spec order, a node's rows are dropped once its last table is framed
+  def frames(self, states: dict):
+    tables_left = collections.Counter(self.spec_nodes.values())
+    for spec in self.specs:
+      node_key = self.spec_nodes[spec.name]
+      df = self.__frame(spec, states[node_key])
+
+      tables_left[node_key] -= 1
+      if not tables_left[node_key]:
+        del states[node_key]
+
+      yield spec.name, df
+
+  def __list_entries(self, node: dict, state: dict, parent_entries: tuple) -> list:
+    rows = state['rows']
+    node_entries = [] if node['has_lists'] else None
+
+    for parent_record, parent_row in parent_entries:
+      value = parent_record.get(node['list_key']) if isinstance(parent_record, dict) else None
+      elements = value if isinstance(value, list) and value else NO_ELEMENTS
+      # the parent's key values, copied into each element's row
+      keys = [(name, parent_row.get(source)) for name, source in node['keys']]
+
+      for element in elements:
+        row = dict(keys)
+        if element is not None:
+          state['has_element'] = True
+        if isinstance(element, dict):
+          flatten_record(element, '_', out=row)
+        if node['row_id']:
+          row['key_id'] = f'{row["key_request_id"]}_{state["row_offset"] + len(rows)}'
+
+        rows.append(row)
+        if node_entries is not None:
+          node_entries.append((element, row))
+
+    return node_entries
+
+  def __frame(self, spec: TableSpec, state: dict) -> pd.DataFrame:
+    if spec.kind == 'list' and not state['has_element']:
+      df = pd.DataFrame(columns=list(spec.keys))
+    else:
+      df = pd.DataFrame(state['rows'])
+
+    if not spec.reindex:
+      return df
+
+    schema_columns = spec.schema_columns
+    df = df.reindex(columns=schema_columns)
+
+    if spec.kind == 'list' and spec.drop_empty:
+      if 'key_request_id' in schema_columns:
+        schema_columns.remove('key_request_id')
+      df.dropna(subset=schema_columns, how='all', inplace=True)
+
+    return df
+
+  def __node(self, spec: TableSpec) -> tuple:
+    if spec.kind == 'json':
+      node_key = ('json', tuple(spec.record_path), spec.json_key)
+      self.nodes.setdefault(node_key, {
+        'kind': 'json', 'record_path': spec.record_path, 'json_key': spec.json_key,
+      })
+      return node_key
+
+    if spec.kind == 'obj':
+      return self.__obj_node(spec.record_path, spec.separator)
+
+    parent_key = self.__node(spec.parent) if spec.parent is not None else self.__obj_node(spec.record_path, '_')
+    node_key = ('list', parent_key, spec.list_key, tuple(spec.keys.items()))
+    node = self.nodes.setdefault(node_key, {
+      'kind': 'list', 'parent': parent_key, 'list_key': spec.list_key,
+      'keys': list(spec.keys.items()), 'row_id': False, 'has_lists': False,
+    })
+    node['row_id'] = node['row_id'] or spec.row_id
+
+    return node_key
+
+  def __obj_node(self, record_path: list, separator: str) -> tuple:
+    node_key = ('obj', tuple(record_path), separator)
+    self.nodes.setdefault(node_key, {
+      'kind': 'obj', 'record_path': record_path, 'separator': separator, 'flatten': False, 'has_lists': False,
+    })
+
+    return node_key
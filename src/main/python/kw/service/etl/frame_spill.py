@@ -0,0 +1,126 @@
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+import numpy as np
+import pandas as pd
+
+# rows converted to Arrow or pickled at a time, so spilling a frame does not copy all of it
+# at once, nor keep a pickle memo of every object in it
+SPILL_BATCH_ROWS = 8192
+
+# Table frames written out while they wait for their table group to load, so a run fits
+# ETL_MEMORY_BUDGET_MB without shrinking the date window.
+#
+# Columns Arrow brings back as they were go to an uncompressed Feather file, read back
+# memory-mapped by pop(); the others (lists, dicts, mixed values) are pickled beside it.
+class FrameSpill:
+  def __init__(self, directory: str=None) -> None:
+    # a directory of this run's own is made under it on the first spill, close() removes it
+    self.directory = directory
+    self.spill_directory = None
+    self.entries = {}
+    self.lock = threading.Lock()
+
+  def __contains__(self, name: str) -> bool:
+    return name in self.entries
+
+  # writes the frame and returns the bytes written
+  def put(self, name: str, df: pd.DataFrame) -> int:
+    import pyarrow as pa
+
+    path = os.path.join(self.__directory(), name)
+    nulls = {column: arrow_nulls(df[column]) for column in df.columns}
+    arrow_columns = [column for column in df.columns if nulls[column] is not None]
+    pickle_columns = [column for column in df.columns if nulls[column] is None]
+
+    entry = {
+      'columns': list(df.columns),
+      'index': df.index,
+      # string columns whose missing values were NaN, Arrow reads them back as None
+      'nan_columns': [column for column in arrow_columns if nulls[column] == 'nan'],
+      'feather': None,
+      'pickle': None,
+    }
+
+    if arrow_columns or not pickle_columns:
+      entry['feather'] = f'{path}.feather'
+      # Feather V2 is the Arrow IPC file format, uncompressed so it can be memory-mapped
+      schema = pa.Schema.from_pandas(df[arrow_columns], preserve_index=False)
+      with pa.ipc.new_file(entry['feather'], schema) as writer:
+        for start in range(0, len(df.index), SPILL_BATCH_ROWS):
+          batch = df[arrow_columns].iloc[start:start + SPILL_BATCH_ROWS]
+          writer.write_batch(pa.RecordBatch.from_pandas(batch, schema=schema, preserve_index=False))
+
+    if pickle_columns:
+      entry['pickle'] = f'{path}.pickle'
+      with open(entry['pickle'], 'wb') as f:
+        for start in range(0, max(1, len(df.index)), SPILL_BATCH_ROWS):
+          pickle.dump(df[pickle_columns].iloc[start:start + SPILL_BATCH_ROWS], f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    with self.lock:
+      self.entries[name] = entry
+
+    return sum(os.path.getsize(path) for path in [entry['feather'], entry['pickle']] if path is not None)
+
+  def pop(self, name: str) -> pd.DataFrame:
+    import pyarrow.feather as feather
+
+    with self.lock:
+      entry = self.entries.pop(name)
+
+    frames = []
+    if entry['feather'] is not None:
+      df = feather.read_table(entry['feather'], memory_map=True).to_pandas()
+      df.index = entry['index']
+      for column in entry['nan_columns']:
+        df[column] = df[column].where(df[column].notna(), np.nan)
+      frames.append(df)
+      os.remove(entry['feather'])
+
+    if entry['pickle'] is not None:
+      with open(entry['pickle'], 'rb') as f:
+        batches = [pickle.load(f) for _ in range(0, max(1, len(entry['index'])), SPILL_BATCH_ROWS)]
+      frames.append(batches[0] if len(batches) == 1 else pd.concat(batches))
+      os.remove(entry['pickle'])
+
+    if len(frames) == 1:
+      return frames[0]
+
+    return pd.concat(frames, axis=1)[entry['columns']]
+
+  def close(self) -> None:
+    if self.spill_directory is not None:
+      shutil.rmtree(self.spill_directory, ignore_errors=True)
+      self.spill_directory = None
+
+    self.entries = {}
+
+  def __directory(self) -> str:
+    with self.lock:
+      if self.spill_directory is None:
+        if self.directory is not None:
+          os.makedirs(self.directory, exist_ok=True)
+        self.spill_directory = tempfile.mkdtemp(prefix='kw-etl-spill-', dir=self.directory)
+
+    return self.spill_directory
+
+# how the missing values of a column Arrow brings back as it was look ('none' or 'nan'),
+# None for a column it does not: object columns other than strings, or mixing both nulls
+def arrow_nulls(series: pd.Series) -> str:
+  if isinstance(series.dtype, pd.StringDtype):
+    return 'none'
+  if series.dtype != object:
+    return 'none' if series.dtype.kind in 'iufbM' else None
+
+  if pd.api.types.infer_dtype(series, skipna=True) != 'string':
+    return None
+
+  missing = series[series.isna()]
+  if all(value is None for value in missing):
+    return 'none'
+  if all(isinstance(value, float) for value in missing):
+    return 'nan'
+
+  return None
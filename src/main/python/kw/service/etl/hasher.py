@@ -0,0 +1,89 @@
+import hashlib
+import multiprocessing
+import os
+import sqlite3
+import threading
+import numpy as np
+import pandas as pd
+
+from concurrent.futures import ProcessPoolExecutor
+
+# dtypes whose unique values map one to one onto their str()
+HOMOGENEOUS_TYPES = ['string', 'integer', 'floating', 'boolean']
+
+def sha256_hex(s: str) -> str:
+  return hashlib.sha256(s.encode('utf-8')).hexdigest()
+
+class Hasher:
+  def __init__(self) -> None:
+    self.workers = int(os.getenv('HASH_WORKERS', '1'))
+    self.pool_threshold = int(os.getenv('HASH_POOL_THRESHOLD', '100000'))
+
+    cache_path = os.getenv('HASH_CACHE_PATH')
+    cache_size = int(os.getenv('HASH_CACHE_SIZE', '1000000'))
+    self.cache = HashCache(cache_path, cache_size) if cache_path else None
+
+  # same digest as sha256(str(value)) per cell, '' for missing values
+  def hash(self, series: pd.Series) -> pd.Series:
+    if pd.api.types.infer_dtype(series, skipna=True) not in HOMOGENEOUS_TYPES:
+      series = series.map(str, na_action='ignore')
+
+    codes, uniques = pd.factorize(series)
+    digests = self.__digests([str(value) for value in uniques])
+
+    # code -1 marks a missing value and takes the trailing ''
+    digests = np.array(digests + [''], dtype=object)
+
+    return pd.Series(digests[codes], index=series.index, name=series.name)
+
+  def __digests(self, values: list) -> list:
+    cached = self.cache.get_many(values) if self.cache is not None else {}
+    missing_values = [value for value in values if value not in cached]
+
+    if self.workers > 1 and len(missing_values) >= self.pool_threshold:
+      chunksize = max(1, len(missing_values) // (self.workers * 4))
+      with ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+        missing_digests = list(executor.map(sha256_hex, missing_values, chunksize=chunksize))
+    else:
+      missing_digests = [sha256_hex(value) for value in missing_values]
+
+    if self.cache is not None:
+      self.cache.put_many(zip(missing_values, missing_digests))
+
+    cached.update(zip(missing_values, missing_digests))
+
+    return [cached[value] for value in values]
+
+class HashCache:
+  # SQLite allows at most 999 host parameters per statement on older builds
+  chunk_size = 900
+
+  def __init__(self, path: str, max_entries: int) -> None:
+    self.max_entries = max_entries
+    # tables may hash from several scheduler threads
+    self.lock = threading.Lock()
+    self.connection = sqlite3.connect(path, check_same_thread=False)
+    self.connection.execute('CREATE TABLE IF NOT EXISTS digests (value TEXT PRIMARY KEY, digest TEXT NOT NULL)')
+
+  def get_many(self, values: list) -> dict:
+    digests = {}
+    with self.lock:
+      for i in range(0, len(values), HashCache.chunk_size):
+        chunk = values[i:i + HashCache.chunk_size]
+        placeholders = ','.join('?' * len(chunk))
+        rows = self.connection.execute(f'SELECT value, digest FROM digests WHERE value IN ({placeholders})', chunk)
+        digests.update(rows)
+
+    return digests
+
+  def put_many(self, items) -> None:
+    with self.lock, self.connection:
+      self.connection.executemany('INSERT OR REPLACE INTO digests (value, digest) VALUES (?, ?)', items)
+
+      # oldest entries go first once the cache is over its bound
+      (count,) = self.connection.execute('SELECT COUNT(*) FROM digests').fetchone()
+      if count > self.max_entries:
+        self.connection.execute(
+          'DELETE FROM digests WHERE rowid IN (SELECT rowid FROM digests ORDER BY rowid LIMIT ?)',
+          (count - self.max_entries,),
+        )
@@ -1,62 +1,399 @@
+import io
+import os
+import re
 import pandas as pd
-import hashlib
 import json
 
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from kw.helper.misc import create_dir
+from kw.helper.hashing_writer import COMPRESSION_EXTENSIONS, HashingTextFile, HashingWriter
+from kw.helper.metrics import Metrics
+from kw.helper.table_file import TABLE_FILES, CsvTableFile
+from kw.helper.misc import extract_schema_columns
+from kw.service.etl.sinks import DiskSink, LocalDirectorySink, StorageSink
 from kw.service.gcs.google_could_storage import GoogleCloudStorage
 
+LOAD_SINKS = ['disk', 'gcs', 'local']
+
+# counts closing a manifest, incremental parts add theirs to the earlier parts'
+MANIFEST_COUNTS = ['deleted_records', 'total_records']
+
+# rows serialized to estimate a table's bytes per row for LOAD_MAX_PART_MB
+PART_SAMPLE_ROWS = 1000
+
 class Loader:
-  def __init__(self, bucket: str, as_of_datetime: datetime) -> None:
+  def __init__(
+      self, bucket: str, as_of_datetime: datetime, streaming: bool=False, part: int=1, storage=None,
+      metrics: Metrics=None, sink=None, shard: int=None, earlier_counts: dict=None,
+  ) -> None:
     self.bucket = bucket
     self.date = as_of_datetime
     self.date_str = self.date.strftime('%Y%m%d')
-    self.gcs = GoogleCloudStorage()
+    self.part = part
+    # {table: manifest counts} of the parts before part, kept by the checkpoint; None when
+    # it has none, the counts are then read from the manifests
+    self.earlier_counts = earlier_counts
+    # {table: manifest counts} published by this run, the earlier parts' included
+    self.counts = {}
+    self.metrics = metrics if metrics is not None else Metrics()
+    # storage is GCS unless given, the sink decides how files reach it
+    self.sink = sink if sink is not None else self.__sink(storage)
+
+    self.compression = os.getenv('LOAD_COMPRESSION', '')
+    if self.compression not in COMPRESSION_EXTENSIONS:
+      raise ValueError('Unsupported LOAD_COMPRESSION: {0}'.format(self.compression))
+
+    self.format = os.getenv('LOAD_FORMAT', 'csv')
+    if self.format not in TABLE_FILES:
+      raise ValueError('Unsupported LOAD_FORMAT: {0}'.format(self.format))
+    self.table_file_class = TABLE_FILES[self.format]
+
+    # tables over either limit are split into parts _1.._N, 0 leaves them in one file. Every
+    # part is a whole file: a CSV part starts with the header line, so parts 2..N are joined
+    # to the first without theirs
+    self.max_part_rows = int(os.getenv('LOAD_MAX_PART_ROWS', '0'))
+    self.max_part_bytes = int(os.getenv('LOAD_MAX_PART_MB', '0')) * 1024 * 1024
+    self.part_workers = int(os.getenv('LOAD_PART_WORKERS', '4'))
+    # number of parts each table was written in
+    self.parts = {}
+
+    # a shard node tags its files with its index and writes its own manifest,
+    # merge_shards() publishes the table's manifest once every shard's is in
+    self.shard = shard
+    self.shard_tag = f'shard{shard}_' if shard is not None else ''
+
+    self.streaming = streaming
+    self.pending_tables = {}
+    # manifests are written by close(), once every table's files are
+    self.pending_manifests = []
+
+  # highest part number written by this run, the next incremental run starts after it
+  @property
+  def last_part(self) -> int:
+    return self.part + max([1, *self.parts.values()]) - 1
+
+  # deleted lists the keys whose earlier rows are superseded, given when change capture is on
+  def load(self, df: pd.DataFrame, schema: str, table_name: str, deleted: pd.DataFrame=None) -> None:
+    if self.streaming:
+      self.__append(df, schema, table_name, deleted)
+      return
+
+    data_records = []
+    if not df.empty:
+      rows_per_part = self.__rows_per_part(df, schema)
+      part_dfs = [df.iloc[start:start + rows_per_part] for start in range(0, len(df.index), rows_per_part)]
+
+      if len(part_dfs) == 1 or self.part_workers <= 1:
+        data_records = [
+          self.__write_part(part_df, schema, table_name, self.part + index)
+          for index, part_df in enumerate(part_dfs)
+        ]
+      else:
+        # parts are serialized and uploaded side by side
+        with ThreadPoolExecutor(
+            max_workers=min(self.part_workers, len(part_dfs)), thread_name_prefix='etl-part',
+        ) as executor:
+          futures = [
+            executor.submit(self.__write_part, part_df, schema, table_name, self.part + index)
+            for index, part_df in enumerate(part_dfs)
+          ]
+          data_records = [future.result() for future in futures]
+
+      self.parts[table_name] = len(part_dfs)
+
+    counts = {'total_records': len(df.index)}
+    if deleted is not None:
+      data_records += self.__write_deletes(deleted, table_name)
+      counts['deleted_records'] = len(deleted.index)
+
+    self.pending_manifests.append((schema, table_name, counts, data_records))
+
+  def flush(self) -> None:
+    for table_name, table in self.pending_tables.items():
+      if table['data_file'] is not None:
+        with self.metrics.measure('write', table_name) as record:
+          record['bytes'] = self.__close_part(table, table_name)
+
+      self.parts[table_name] = len(table['data_records'])
+
+      counts = {'total_records': table['total_records']}
+      if table['deleted'] is not None:
+        deleted = pd.concat(table['deleted'], ignore_index=True)
+        table['data_records'] += self.__write_deletes(deleted, table_name)
+        counts['deleted_records'] = len(deleted.index)
+
+      self.pending_manifests.append((table['schema'], table_name, counts, table['data_records']))
+
+    self.pending_tables = {}
+
+  def close(self) -> None:
+    if self.streaming:
+      self.flush()
+
+    for schema, table_name, counts, data_records in self.pending_manifests:
+      self.__publish(schema, table_name, counts=counts, data_records=data_records)
+    self.pending_manifests = []
+
+    self.sink.wait()
+
+  # discards the table files still open, so a failed run leaves no partial data behind
+  # and the day's manifests as they were
+  def abort(self) -> None:
+    for table in self.pending_tables.values():
+      if table['raw'] is not None:
+        table['raw'].abort()
+
+    self.pending_tables = {}
+    self.pending_manifests = []
+
+  def __append(self, df: pd.DataFrame, schema: str, table_name: str, deleted: pd.DataFrame=None) -> None:
+    if table_name not in self.pending_tables:
+      self.pending_tables[table_name] = {
+        'schema': schema,
+        'columns': extract_schema_columns(schema),
+        'data_file': None,
+        'raw': None,
+        'part': self.part,
+        'part_rows': 0,
+        'data_records': [],
+        'total_records': 0,
+        'deleted': None,
+      }
+
+    table = self.pending_tables[table_name]
+    if deleted is not None:
+      table['deleted'] = (table['deleted'] or []) + [deleted]
+    if df.empty:
+      return
+
+    # batches may flatten to different columns, so every batch is aligned to the schema
+    df = df.reindex(columns=table['columns'])
+
+    with self.metrics.measure('write', table_name) as record:
+      record['bytes'] = 0
+
+      # a part that reached a limit is closed and the batch goes on in the next one
+      start = 0
+      while start < len(df.index):
+        if table['data_file'] is not None and self.__part_full(table):
+          record['bytes'] += self.__close_part(table, table_name)
+          table['part'] += 1
+
+        if table['data_file'] is None:
+          table['data_file'], table['raw'] = self.__open_data(table_name, schema, table['part'])
+          table['part_rows'] = 0
+
+        rows = len(df.index) - start
+        if self.max_part_rows:
+          rows = min(rows, self.max_part_rows - table['part_rows'])
+
+        bytes_written = table['data_file'].bytes_written()
+        table['data_file'].write(df.iloc[start:start + rows])
+        record['bytes'] += table['data_file'].bytes_written() - bytes_written
+
+        table['part_rows'] += rows
+        start += rows
+
+      table['total_records'] += len(df.index)
+      record['rows'] = len(df.index)
+
+  def __part_full(self, table: dict) -> bool:
+    if self.max_part_rows and table['part_rows'] >= self.max_part_rows:
+      return True
 
-  def load(self, df: pd.DataFrame, schema: str, table_name: str) -> None:
-    gcs_path = f'{self.bucket}/{table_name}/{self.date.year}'
-    create_dir(gcs_path)
+    return bool(self.max_part_bytes) and table['data_file'].bytes_written() >= self.max_part_bytes
 
-    gcs_csv_filename = f'{table_name}_{self.date_str}_1.csv'
-    gcs_csv_file_path = f'{gcs_path}/{gcs_csv_filename}'
+  # closes the open part of a streamed table and returns the bytes written by closing it
+  def __close_part(self, table: dict, table_name: str) -> int:
+    data_file = table['data_file']
+    bytes_written = data_file.bytes_written()
+    data_file.close()
+
+    table['data_records'].append(f'{data_file.hexdigest()} {self.__data_filename(table_name, table["part"])}')
+    table['data_file'] = None
+    table['raw'] = None
+
+    return data_file.bytes_written() - bytes_written
+
+  def __write_part(self, df: pd.DataFrame, schema: str, table_name: str, part: int) -> str:
+    with self.metrics.measure('write', table_name) as record:
+      data_file, raw = self.__open_data(table_name, schema, part)
+      try:
+        data_file.write(df)
+        data_file.close()
+      except BaseException:
+        raw.abort()
+        raise
+
+      record['rows'] = len(df.index)
+      record['bytes'] = data_file.bytes_written()
+
+    return f'{data_file.hexdigest()} {self.__data_filename(table_name, part)}'
+
+  def __rows_per_part(self, df: pd.DataFrame, schema: str) -> int:
+    rows_per_part = self.max_part_rows or len(df.index)
+
+    if self.max_part_bytes:
+      # bytes per row are estimated by serializing rows spread over the table in the output format
+      sample = df.iloc[::max(1, len(df.index) // PART_SAMPLE_ROWS)]
+      sample_file = self.table_file_class(io.BytesIO(), schema, self.compression)
+      sample_file.write(sample)
+      sample_file.close()
+
+      row_bytes = sample_file.bytes_written() / len(sample.index)
+      rows_per_part = min(rows_per_part, int(self.max_part_bytes // row_bytes))
+
+    return max(1, rows_per_part)
+
+  def __publish(self, schema: str, table_name: str, counts: dict, data_records: list) -> None:
+    gcs_path = self.__gcs_path(table_name)
 
     gcs_schema_filename = f'{table_name}_{self.date_str}.schema'
     gcs_schema_file_path = f'{gcs_path}/{gcs_schema_filename}'
 
-    gcs_hash_filename = f'{table_name}_{self.date_str}.sha256'
-    gcs_hash_file_path = f'{gcs_path}/{gcs_hash_filename}'
+    gcs_hash_file_path = f'{gcs_path}/{self.__hash_filename(table_name, self.shard)}'
 
-    self.__copy_schema(src=schema, dst=gcs_schema_file_path)
+    schema_digest = self.__copy_schema(src=schema, dst=gcs_schema_file_path, table_name=table_name)
 
     hash_records = []
-    if not df.empty:
-      df.to_csv(gcs_csv_file_path, index=False)
-      hash_records.append(f'{self.__sha256_file(gcs_csv_file_path)} {gcs_csv_filename}')
 
-      self.gcs.upload(src=gcs_csv_file_path)
+    # incremental parts extend the manifest written by the earlier parts of the day
+    if self.part > 1:
+      part_records, part_counts = self.__read_manifest(gcs_hash_file_path, gcs_schema_filename)
+
+      # records of this run's parts are there when an earlier attempt failed after writing the
+      # manifest; they are replaced, and its counts are taken from the checkpoint instead
+      earlier_records = [record for record in part_records if self.__record_part(record, table_name) < self.part]
+      if len(earlier_records) < len(part_records) and self.earlier_counts is not None:
+        part_counts = self.earlier_counts.get(table_name, {})
+
+      hash_records.extend(earlier_records)
+      counts = {
+        key: counts.get(key, 0) + part_counts.get(key, 0)
+        for key in MANIFEST_COUNTS if key in counts or key in part_counts
+      }
+
+    hash_records.extend(data_records)
+    hash_records.append(f'{schema_digest} {gcs_schema_filename}')
+    self.__write_manifest(gcs_hash_file_path, table_name, hash_records, counts)
+    self.counts[table_name] = counts
+
+  # part number of a data or deletes record of this node's files, 0 for other records
+  def __record_part(self, record: str, table_name: str) -> int:
+    filename = record.split(' ', 1)[1]
+    match = re.match(rf'{re.escape(table_name)}_{self.date_str}(?:_|\.deletes_){self.shard_tag}(\d+)\.', filename)
+
+    return int(match.group(1)) if match is not None else 0
+
+  # coordinator step of a sharded run: the shards' manifests, in shard order, become the
+  # table's manifest, with their counts added up
+  def merge_shards(self, table_names: list, shard_count: int) -> None:
+    for table_name in table_names:
+      gcs_path = self.__gcs_path(table_name)
+      gcs_schema_filename = f'{table_name}_{self.date_str}.schema'
+
+      hash_records = []
+      counts = {}
+      for shard in range(shard_count):
+        shard_hash_file_path = f'{gcs_path}/{self.__hash_filename(table_name, shard)}'
+        manifest = self.sink.read(shard_hash_file_path)
+        if manifest is None:
+          raise RuntimeError('Missing manifest of shard {0} of {1}: {2}'.format(shard, shard_count, shard_hash_file_path))
 
-    hash_records.append(f'{self.__sha256_file(gcs_schema_file_path)} {gcs_schema_filename}')
-    hash_records.append(f'total_records {len(df.index)}')
+        part_records, schema_record, part_counts = self.__parse_manifest(manifest, gcs_schema_filename)
+        hash_records.extend(part_records)
+        for key, value in part_counts.items():
+          counts[key] = counts.get(key, 0) + value
 
-    with open(gcs_hash_file_path, 'w') as hash_file:
-      for record in hash_records:
-        hash_file.write(f'{record}\n')
-    hash_file.close
+      hash_records.append(schema_record)
+      self.__write_manifest(f'{gcs_path}/{self.__hash_filename(table_name)}', table_name, hash_records, counts)
 
-    self.gcs.upload(src=gcs_schema_file_path)
-    self.gcs.upload(src=gcs_hash_file_path)
+    self.sink.wait()
 
-  def __copy_schema(self, src, dst) -> None:
-    with open(dst, 'w') as dst_file:
-      json_file = open(src)
+  def __write_manifest(self, hash_file_path: str, table_name: str, hash_records: list, counts: dict) -> None:
+    hash_records = hash_records + [f'{key} {counts[key]}' for key in MANIFEST_COUNTS if key in counts]
+
+    hash_file = HashingWriter(self.sink.open(hash_file_path, table_name))
+    hash_file.write(''.join(f'{record}\n' for record in hash_records).encode('utf-8'))
+    hash_file.close()
+
+  def __hash_filename(self, table_name: str, shard: int=None) -> str:
+    if shard is None:
+      return f'{table_name}_{self.date_str}.sha256'
+
+    return f'{table_name}_{self.date_str}.shard{shard}.sha256'
+
+  def __read_manifest(self, hash_file_path: str, schema_filename: str) -> tuple:
+    manifest = self.sink.read(hash_file_path)
+    if manifest is None:
+      return [], {}
+
+    part_records, _, counts = self.__parse_manifest(manifest, schema_filename)
+    return part_records, counts
+
+  # (data and deletes records, schema record, counts)
+  def __parse_manifest(self, manifest: bytes, schema_filename: str) -> tuple:
+    part_records = []
+    schema_record = None
+    counts = {}
+    for record in manifest.decode('utf-8').splitlines():
+      key, value = record.split(' ', 1)
+      if key in MANIFEST_COUNTS:
+        counts[key] = int(value)
+      elif value == schema_filename:
+        schema_record = record
+      else:
+        part_records.append(record)
+
+    return part_records, schema_record, counts
+
+  # keys whose earlier rows the warehouse deletes before loading the new ones, always csv
+  def __write_deletes(self, deleted: pd.DataFrame, table_name: str) -> list:
+    if deleted.empty:
+      return []
+
+    with self.metrics.measure('write_deletes', table_name) as record:
+      filename = f'{table_name}_{self.date_str}.deletes_{self.shard_tag}{self.part}{CsvTableFile.extension(self.compression)}'
+      raw = self.sink.open(f'{self.__gcs_path(table_name)}/{filename}', table_name)
+      deletes_file = CsvTableFile(raw, schema='', compression=self.compression)
+      deletes_file.write(deleted)
+      deletes_file.close()
+
+      record['rows'] = len(deleted.index)
+      record['bytes'] = deletes_file.bytes_written()
+
+    return [f'{deletes_file.hexdigest()} {filename}']
+
+  def __open_data(self, table_name: str, schema: str, part: int) -> tuple:
+    raw = self.sink.open(f'{self.__gcs_path(table_name)}/{self.__data_filename(table_name, part)}', table_name)
+    return self.table_file_class(raw, schema, self.compression), raw
+
+  def __gcs_path(self, table_name: str) -> str:
+    return f'{self.bucket}/{table_name}/{self.date.year}'
+
+  def __data_filename(self, table_name: str, part: int) -> str:
+    return f'{table_name}_{self.date_str}_{self.shard_tag}{part}{self.table_file_class.extension(self.compression)}'
+
+  def __copy_schema(self, src, dst, table_name: str) -> str:
+    schema_file = HashingTextFile(self.sink.open(dst, table_name))
+    with open(src) as json_file:
       data = json.load(json_file)
-      json.dump(data, dst_file)
-    dst_file.close
+    json.dump(data, schema_file.text)
+    schema_file.close()
+
+    return schema_file.hexdigest()
+
+  def __sink(self, storage):
+    load_sink = os.getenv('LOAD_SINK', 'disk')
+    if load_sink not in LOAD_SINKS:
+      raise ValueError('Unsupported LOAD_SINK: {0}'.format(load_sink))
+
+    if load_sink == 'local':
+      return LocalDirectorySink(os.getenv('LOAD_LOCAL_DIR', 'output'))
 
-  def __sha256_file(self, file_path: str) -> str:
-    with open(file_path, 'rb') as file:
-      content = file.read()
-      hash_content = hashlib.sha256(content).hexdigest()
-    file.close
+    storage = storage if storage is not None else GoogleCloudStorage(self.metrics)
+    if load_sink == 'gcs':
+      # serialized straight into the blob upload, nothing is written to the local disk
+      return StorageSink(storage)
 
-    return hash_content
+    return DiskSink(storage)
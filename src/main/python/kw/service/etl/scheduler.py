@@ -0,0 +1,53 @@
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+# Runs a graph of tasks given as {name: (callable, [dependency names])}
+class Scheduler:
+  def __init__(self, workers: int=1) -> None:
+    self.workers = workers
+
+  def run(self, tasks: dict) -> None:
+    if self.workers <= 1:
+      for name in self.__order(tasks):
+        tasks[name][0]()
+      return
+
+    pending = dict(tasks)
+    running = {}
+    done = set()
+    error = None
+
+    with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='etl-table') as executor:
+      while pending or running:
+        if error is None:
+          ready = [name for name, (_, dependencies) in pending.items() if done.issuperset(dependencies)]
+          for name in ready:
+            running[executor.submit(pending.pop(name)[0])] = name
+
+        if not running:
+          break
+
+        finished, _ = wait(running, return_when=FIRST_COMPLETED)
+        for future in finished:
+          done.add(running.pop(future))
+          if error is None and future.exception() is not None:
+            error = future.exception()
+
+    if error is not None:
+      raise error
+
+    if pending:
+      raise ValueError('Unresolvable task dependencies: {0}'.format(', '.join(pending)))
+
+  def __order(self, tasks: dict) -> list:
+    order = []
+    pending = dict(tasks)
+
+    while pending:
+      ready = next((name for name, (_, dependencies) in pending.items() if set(order).issuperset(dependencies)), None)
+      if ready is None:
+        raise ValueError('Unresolvable task dependencies: {0}'.format(', '.join(pending)))
+
+      order.append(ready)
+      pending.pop(ready)
+
+    return order
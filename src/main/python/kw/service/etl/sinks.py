@@ -0,0 +1,110 @@
+import io
+import os
+
+from kw.helper.misc import create_dir
+
+# Raw binary stream a sink hands to the table files.
+#
+# Closing commits what was written. abort() discards it instead: writes and closes that
+# follow, e.g. from wrappers being collected, are ignored.
+#
+# A HashingWriter on top sets digest to the sha256 of the content before closing it.
+class SinkStream(io.RawIOBase):
+  def __init__(self, raw, on_commit=None, on_abort=None) -> None:
+    self.raw = raw
+    self.on_commit = on_commit
+    self.on_abort = on_abort
+    self.aborted = False
+    self.digest = None
+
+  def writable(self) -> bool:
+    return True
+
+  def write(self, b) -> int:
+    if not self.aborted:
+      self.raw.write(b)
+
+    return len(b)
+
+  def close(self) -> None:
+    if self.closed:
+      return
+
+    super().close()
+    if not self.aborted:
+      self.raw.close()
+      if self.on_commit is not None:
+        self.on_commit(self.digest)
+
+  def abort(self) -> None:
+    if self.closed or self.aborted:
+      return
+
+    self.aborted = True
+    self.raw.close()
+    if self.on_abort is not None:
+      self.on_abort()
+
+# Writes files to the local disk and uploads each one once it is closed, unless the
+# bucket already has the same content under that path
+class DiskSink:
+  def __init__(self, storage) -> None:
+    self.storage = storage
+
+  def open(self, path: str, table: str='') -> SinkStream:
+    create_dir(os.path.dirname(path))
+    return SinkStream(
+      open(path, 'wb'),
+      on_commit=lambda digest: self.storage.upload_async(src=path, table=table, sha256=digest),
+      on_abort=lambda: os.remove(path),
+    )
+
+  # from the bucket when this machine did not write the file, e.g. another shard's manifest
+  def read(self, path: str) -> bytes:
+    if not os.path.exists(path):
+      return self.storage.download(path)
+
+    with open(path, 'rb') as f:
+      return f.read()
+
+  def wait(self) -> None:
+    self.storage.wait()
+
+# Streams files straight into blobs, in chunks, nothing lands on the local disk
+class StorageSink:
+  def __init__(self, storage) -> None:
+    self.storage = storage
+
+  def open(self, path: str, table: str='') -> SinkStream:
+    # an aborted upload is finalized with what it had, so the blob is removed afterwards
+    return SinkStream(
+      self.storage.open(path),
+      on_abort=lambda: self.storage.delete(path),
+    )
+
+  def read(self, path: str) -> bytes:
+    return self.storage.download(path)
+
+  def wait(self) -> None:
+    pass
+
+# Writes files under a local directory, a stand-in for the bucket in tests and benchmarks
+class LocalDirectorySink:
+  def __init__(self, root: str) -> None:
+    self.root = root
+
+  def open(self, path: str, table: str='') -> SinkStream:
+    local_path = os.path.join(self.root, path)
+    create_dir(os.path.dirname(local_path))
+    return SinkStream(open(local_path, 'wb'), on_abort=lambda: os.remove(local_path))
+
+  def read(self, path: str) -> bytes:
+    local_path = os.path.join(self.root, path)
+    if not os.path.exists(local_path):
+      return None
+
+    with open(local_path, 'rb') as f:
+      return f.read()
+
+  def wait(self) -> None:
+    pass
@@ -0,0 +1,61 @@
+from kw.helper.misc import extract_schema_columns
+from kw.helper.schema_cast import schema_types
+
+# Declarative definition of one output table.
+#
+# A table is framed from one of:
+#   record_path                  - the flattened sub document at record_path, one row per document
+#   record_path + list_key       - one row per element of the list at record_path.list_key
+#   parent + list_key            - one row per element of the list list_key in each parent table row
+#   record_path + json_key       - record_path.json_key dumped to a JSON string, one row per document
+#
+#   keys         - {output column: parent row column} copied onto every list row
+#   row_id       - adds key_id (key_request_id + '_' + row number) for child tables to refer to
+#   reindex      - aligns the frame to the schema columns
+#   drop_empty   - drops list rows whose schema columns (except key_request_id) are all empty
+#   transform    - callable changing the framed DataFrame in place before hashing and casting
+#
+# Column types come from the schema file, see SchemaCaster.
+class TableSpec:
+  def __init__(
+      self, name: str, schema: str, record_path: list=None, parent: 'TableSpec'=None,
+      list_key: str=None, json_key: str=None, keys: dict=None, separator: str='_',
+      row_id: bool=False, reindex: bool=True, drop_empty: bool=True,
+      hash_columns: list=None, transform=None,
+  ) -> None:
+    self.name = name
+    self.schema = schema
+    self.record_path = record_path if parent is None else parent.record_path
+    self.parent = parent
+    self.list_key = list_key
+    self.json_key = json_key
+    self.keys = {'key_request_id': 'key_request_id'} if keys is None else keys
+    self.separator = separator
+    self.row_id = row_id
+    self.reindex = reindex
+    self.drop_empty = drop_empty
+    self.hash_columns = hash_columns or []
+    self.transform = transform
+
+    self.__schema_columns = None
+    self.__schema_types = None
+
+  @property
+  def kind(self) -> str:
+    if self.json_key is not None:
+      return 'json'
+    if self.list_key is not None:
+      return 'list'
+    return 'obj'
+
+  @property
+  def schema_columns(self) -> list:
+    if self.__schema_columns is None:
+      self.__schema_columns = extract_schema_columns(self.schema)
+    return list(self.__schema_columns)
+
+  @property
+  def schema_types(self) -> dict:
+    if self.__schema_types is None:
+      self.__schema_types = schema_types(self.schema)
+    return self.__schema_types
@@ -0,0 +1,345 @@
+import pandas as pd
+
+from kw.json.mongo_json_encoder import TIMESTAMP_FORMAT
+from kw.service.etl.table_spec import TableSpec
+
+def join_source_names(df: pd.DataFrame) -> None:
+  if not df.empty:
+    df['source_name'] = df['source_name'].str.join('|')
+
+def bangkok_datetime_to_utc(df: pd.DataFrame) -> None:
+  df.DATETIME = pd.to_datetime(df.DATETIME) \
+    .dt.tz_localize('Asia/Bangkok') \
+    .dt.tz_convert('UTC') \
+    .dt.strftime(TIMESTAMP_FORMAT)
+
+# application
+#.----------.----------.----------.----------.----------.
+APPLICATION = [
+  TableSpec(
+    'application', 'schema/application/application_schema.json',
+    record_path=['decision_input_data', 'application'],
+    hash_columns=[
+      'personal_info_national_thai_id',
+      'personal_info_first_name_en', 'personal_info_last_name_en',
+      'personal_info_first_name_th', 'personal_info_last_name_th',
+      'personal_info_mobile_number', 'personal_info_contact_number',
+      'personal_info_email', 'work_address_office_phone_no'
+    ],
+  ),
+  TableSpec(
+    'application_consent_list', 'schema/application/application_consent_list_schema.json',
+    record_path=['decision_input_data', 'application'], list_key='consent_list',
+  ),
+  TableSpec(
+    'application_financial_institution_list', 'schema/application/application_financial_institution_list_schema.json',
+    record_path=['decision_input_data', 'application'], list_key='financial_institution_list',
+  ),
+  TableSpec(
+    'application_questionnaire_list', 'schema/application/application_questionnaire_list_schema.json',
+    record_path=['decision_input_data', 'application'], list_key='questionnaire_list',
+  ),
+]
+
+# bankruptcy
+#.----------.----------.----------.----------.----------.
+BANKRUPTCY = [
+  TableSpec(
+    'bankruptcy', 'schema/bankruptcy/bankruptcy_schema.json',
+    record_path=['decision_input_data', 'bankruptcy'],
+  ),
+]
+
+# decision
+#.----------.----------.----------.----------.----------.
+DECISION = [
+  TableSpec(
+    'decision', 'schema/decision/decision_schema.json',
+    record_path=[], separator='->',
+  ),
+]
+
+# decision_input_data
+#.----------.----------.----------.----------.----------.
+DECISION_INPUT_DATA = [
+  TableSpec(
+    'decision_input_data', 'schema/decision_input_data/decision_input_data_schema.json',
+    record_path=['decision_input_data'],
+  ),
+  TableSpec(
+    'decision_input_data_sources', 'schema/decision_input_data/decision_input_data_sources_schema.json',
+    record_path=['decision_input_data'], list_key='sources',
+    transform=join_source_names,
+  ),
+]
+
+DECISION_INPUT_DATA_DECISION_OUTPUT_DATA = [
+  TableSpec(
+    'decision_input_data_decision_output_data',
+    'schema/decision_input_data/decision_input_data_decision_output_data_schema.json',
+    record_path=['decision_input_data', 'decision_output_data'],
+  ),
+]
+
+# decision_output_data
+#.----------.----------.----------.----------.----------.
+DECISION_OUTPUT_DATA = [
+  TableSpec(
+    'decision_output_data', 'schema/decision_output_data/decision_output_data_schema.json',
+    record_path=['decision_output_data'],
+    transform=bangkok_datetime_to_utc,
+  ),
+]
+
+# employee
+#.----------.----------.----------.----------.----------.
+EMPLOYEE = [
+  TableSpec(
+    'employee', 'schema/employee/employee_schema.json',
+    record_path=['decision_input_data', 'employee'],
+  ),
+]
+
+# existing_loan_accounts
+#.----------.----------.----------.----------.----------.
+EXISTING_LOAN_ACCOUNTS = [
+  TableSpec(
+    'existing_loan_accounts', 'schema/existing_loan_accounts/existing_loan_accounts_schema.json',
+    record_path=['decision_input_data', 'existing_loan_accounts'],
+  ),
+  TableSpec(
+    'existing_loan_accounts_accounts', 'schema/existing_loan_accounts/existing_loan_accounts_accounts_schema.json',
+    record_path=['decision_input_data', 'existing_loan_accounts'], list_key='accounts',
+  ),
+]
+
+# financial_profile
+#.----------.----------.----------.----------.----------.
+FINANCIAL_PROFILE = [
+  TableSpec(
+    'financial_profile', 'schema/financial_profile/financial_profile_schema.json',
+    record_path=['decision_input_data', 'financial_profile'],
+  ),
+]
+
+_statement_accounts = TableSpec(
+  'financial_profile_profile_income_statement_accounts',
+  'schema/financial_profile/financial_profile_profile_income_statement_accounts_schema.json',
+  record_path=['decision_input_data', 'financial_profile', 'profile', 'income', 'statement'], list_key='accounts',
+  row_id=True, drop_empty=False,
+)
+
+FINANCIAL_PROFILE_PROFILE_INCOME_STATEMENTS_ACCOUNTS = [
+  _statement_accounts,
+  TableSpec(
+    'financial_profile_profile_income_statement_accounts_invoice',
+    'schema/financial_profile/financial_profile_profile_income_statement_accounts_invoice_schema.json',
+    parent=_statement_accounts, list_key='invoice', keys={'key_parent_id': 'key_id'},
+  ),
+  TableSpec(
+    'financial_profile_profile_income_statement_accounts_subscriber',
+    'schema/financial_profile/financial_profile_profile_income_statement_accounts_subscriber_schema.json',
+    parent=_statement_accounts, list_key='subscriber', keys={'key_parent_id': 'key_id'},
+  ),
+]
+
+# financial_whitelist
+#.----------.----------.----------.----------.----------.
+FINANCIAL_WHITELIST = [
+  TableSpec(
+    'financial_whitelist', 'schema/financial_whitelist/financial_whitelist_schema.json',
+    record_path=['decision_input_data', 'financial_whitelist'],
+    hash_columns=['mobile', 'thai_id'],
+  ),
+]
+
+# lending_blacklist
+#.----------.----------.----------.----------.----------.
+LENDING_BLACKLIST = [
+  TableSpec(
+    'lending_blacklist', 'schema/lending_blacklist/lending_blacklist_schema.json',
+    record_path=['decision_input_data', 'lending_blacklist'],
+  ),
+  TableSpec(
+    'lending_blacklist_blacklist', 'schema/lending_blacklist/lending_blacklist_blacklist_schema.json',
+    record_path=['decision_input_data', 'lending_blacklist'], list_key='blacklist',
+    reindex=False, drop_empty=False,
+    hash_columns=['_id'],
+  ),
+]
+
+# ncrs
+#.----------.----------.----------.----------.----------.
+NCRS = [
+  TableSpec(
+    'ncrs', 'schema/ncrs/ncrs_schema.json',
+    record_path=['decision_input_data', 'ncrs'],
+  ),
+]
+
+# phone_metadata
+#.----------.----------.----------.----------.----------.
+PHONE_METADATA = [
+  TableSpec(
+    'phone_metadata', 'schema/phone_metadata/phone_metadata_schema.json',
+    record_path=['decision_input_data'], json_key='phone_metadata',
+  ),
+]
+
+# ta_score
+#.----------.----------.----------.----------.----------.
+TA_SCORE = [
+  TableSpec(
+    'true_analytics_score', 'schema/ta_score/ta_score_schema.json',
+    record_path=['decision_input_data', 'true_analytics_score'],
+  ),
+  TableSpec(
+    'true_analytics_score_result', 'schema/ta_score/ta_score_result_schema.json',
+    record_path=['decision_input_data', 'true_analytics_score'], list_key='results',
+  ),
+]
+
+# tdg
+#.----------.----------.----------.----------.----------.
+_tdg_results = TableSpec(
+  'tdg_results', 'schema/tdg/tdg_results_schema.json',
+  record_path=['decision_input_data', 'tdg'], list_key='results',
+  row_id=True, drop_empty=False,
+)
+
+TDG = [
+  TableSpec(
+    'tdg', 'schema/tdg/tdg_schema.json',
+    record_path=['decision_input_data', 'tdg'],
+  ),
+  _tdg_results,
+  TableSpec(
+    'tdg_results_product_scores', 'schema/tdg/tdg_results_product_scores_schema.json',
+    parent=_tdg_results, list_key='product_scores', keys={'key_parent_id': 'key_id'},
+  ),
+]
+
+# tmn_score
+#.----------.----------.----------.----------.----------.
+TMN_SCORE = [
+  TableSpec(
+    'tmn_score', 'schema/tmn_score/tmn_score_schema.json',
+    record_path=['decision_input_data', 'tmn_score'],
+  ),
+]
+
+# wallet_blacklist
+#.----------.----------.----------.----------.----------.
+WALLET_BLACKLIST = [
+  TableSpec(
+    'wallet_blacklist', 'schema/wallet_blacklist/wallet_blacklist_schema.json',
+    record_path=['decision_input_data', 'wallet_blacklist'],
+  ),
+  TableSpec(
+    'wallet_blacklist_wallet_blacklist', 'schema/wallet_blacklist/wallet_blacklist_wallet_blacklist_schema.json',
+    record_path=['decision_input_data', 'wallet_blacklist'], list_key='wallet_blacklist',
+    reindex=False, drop_empty=False,
+  ),
+]
+
+# Table groups selectable for a run, in load order
+TABLES = {
+  'application': APPLICATION,
+  'bankruptcy': BANKRUPTCY,
+  'decision': DECISION,
+  'decision_input_data': DECISION_INPUT_DATA,
+  'decision_input_data_decision_output_data': DECISION_INPUT_DATA_DECISION_OUTPUT_DATA,
+  'decision_output_data': DECISION_OUTPUT_DATA,
+  'employee': EMPLOYEE,
+  'existing_loan_accounts': EXISTING_LOAN_ACCOUNTS,
+  'financial_profile': FINANCIAL_PROFILE,
+  'financial_profile_profile_income_statements_accounts': FINANCIAL_PROFILE_PROFILE_INCOME_STATEMENTS_ACCOUNTS,
+  'financial_whitelist': FINANCIAL_WHITELIST,
+  'lending_blacklist': LENDING_BLACKLIST,
+  'ncrs': NCRS,
+  'phone_metadata': PHONE_METADATA,
+  'ta_score': TA_SCORE,
+  'tdg': TDG,
+  'tmn_score': TMN_SCORE,
+  'wallet_blacklist': WALLET_BLACKLIST,
+}
+
+DERIVED_COLUMNS = ['key_request_id', 'key_parent_id', 'key_id']
+
+def table_specs(table_names: list) -> list:
+  return [spec for table_name in table_names for spec in TABLES[table_name]]
+
+def build_projection(table_names: list) -> dict:
+  paths = set()
+  for spec in table_specs(table_names):
+    paths.update(_spec_paths(spec))
+
+  # Mongo rejects a projection holding both a path and one of its ancestors
+  projection = {}
+  for path in sorted(paths):
+    if not any(path.startswith(f'{ancestor}.') for ancestor in projection):
+      projection[path] = 1
+
+  return projection
+
+# Paths of the json tables' subdocuments no other selected table reads, the extractor dumps
+# them to JSON once instead of converting them and dumping again when framing.
+def build_passthrough(table_names: list) -> list:
+  specs = table_specs(table_names)
+  json_paths = ['.'.join(spec.record_path + [spec.json_key]) for spec in specs if spec.kind == 'json']
+
+  passthrough = []
+  for json_path in json_paths:
+    shared = False
+    for spec in specs:
+      if spec.kind == 'json':
+        continue
+
+      # an obj table framed without its schema keeps every field under its record path
+      record_path = '.'.join(spec.record_path)
+      if spec.kind == 'obj' and not spec.reindex and (not record_path or json_path.startswith(f'{record_path}.')):
+        shared = True
+
+      for path in _spec_paths(spec):
+        if path == json_path or path.startswith(f'{json_path}.') or json_path.startswith(f'{path}.'):
+          shared = True
+
+    if not shared:
+      passthrough.append(json_path.split('.'))
+
+  return passthrough
+
+def _spec_paths(spec: TableSpec) -> set:
+  paths = set()
+
+  while spec.parent is not None:
+    spec = spec.parent
+  record_path = spec.record_path
+
+  if spec.kind == 'json':
+    return {'.'.join(record_path + [spec.json_key])}
+
+  if spec.kind == 'list':
+    return {'.'.join(record_path + [spec.list_key])}
+
+  for column in spec.schema_columns:
+    if column in DERIVED_COLUMNS:
+      continue
+
+    if not record_path:
+      # the root frame keeps the '->' separator so the path is exact
+      paths.add(column.replace('->', '.'))
+      continue
+
+    # '_' is ambiguous between a field name and a flattened path, so every
+    # candidate field under record_path is projected as a whole
+    for field in _field_candidates(column):
+      paths.add('.'.join(record_path + [field]))
+
+  return paths
+
+def _field_candidates(column: str) -> list:
+  candidates = [column[:i] for i, c in enumerate(column) if c == '_' and i > 0]
+  candidates.append(column)
+
+  return candidates
@@ -1,14 +1,107 @@
+import mimetypes
 import os
 
-from google.cloud import storage
+from concurrent.futures import ThreadPoolExecutor
+from kw.helper.metrics import Metrics
+from kw.service.gcs.upload_manifest import UploadManifest
 
+# the Google SDK is imported when a client is built, not when the module is
 class GoogleCloudStorage:
-  def __init__(self) -> None:
+  def __init__(self, metrics: Metrics=None) -> None:
+    from google.cloud import storage
+    from requests.adapters import HTTPAdapter
+
+    self.metrics = metrics if metrics is not None else Metrics()
+    self.workers = int(os.getenv('UPLOAD_WORKERS', '4'))
+    self.chunk_size = int(os.getenv('UPLOAD_CHUNK_SIZE_MB', '32')) * 1024 * 1024
+
+    # files whose sha256 the bucket already stores for their path are not uploaded again;
+    # with UPLOAD_MANIFEST_PATH set, files recorded under another digest skip asking the bucket
+    self.skip_unchanged = os.getenv('UPLOAD_SKIP_UNCHANGED', 'true').lower() in ['1', 'true', 'yes']
+    manifest_path = os.getenv('UPLOAD_MANIFEST_PATH', '')
+    manifest_entries = int(os.getenv('UPLOAD_MANIFEST_MAX_ENTRIES', '100000'))
+    self.manifest = UploadManifest(manifest_path, manifest_entries) if manifest_path else None
+
     self.client = storage.Client()
+    # every upload thread shares the client's session, so its connection pool is sized to match
+    self.client._http.mount('https://', HTTPAdapter(pool_connections=self.workers, pool_maxsize=self.workers))
     self.bucket = self.client.bucket(os.getenv('bucketName'))
 
-  def upload(self, src: str) -> None:
-    blob = self.bucket.blob(src)
-    blob.upload_from_filename(src)
+    self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='gcs-upload')
+    self.futures = []
+
+  def upload(self, src: str, table: str='', sha256: str=None) -> None:
+    if sha256 is not None and self.skip_unchanged:
+      with self.metrics.measure('upload_check', table):
+        unchanged = self.__unchanged(src, sha256)
+
+      if unchanged:
+        self.__record(src, sha256)
+        return
+
+    with self.metrics.measure('upload', table) as record:
+      size = os.path.getsize(src)
+      # files larger than one chunk go up as a chunked resumable upload
+      chunk_size = self.chunk_size if size > self.chunk_size else None
+
+      blob = self.bucket.blob(src, chunk_size=chunk_size)
+      if sha256 is not None:
+        blob.metadata = {'sha256': sha256}
+      blob.upload_from_filename(src)
+
+      record['bytes'] = size
+
+    if sha256 is not None:
+      self.__record(src, sha256)
+
+  def upload_async(self, src: str, table: str='', sha256: str=None) -> None:
+    self.futures.append(self.executor.submit(self.upload, src, table, sha256))
+
+  # a writable stream uploading chunk by chunk, the blob is finalized on close
+  def open(self, path: str):
+    content_type, _ = mimetypes.guess_type(path)
+    blob = self.bucket.blob(path, chunk_size=self.chunk_size)
+
+    return blob.open('wb', ignore_flush=True, content_type=content_type or 'application/octet-stream')
+
+  def download(self, path: str) -> bytes:
+    from google.api_core.exceptions import NotFound
+
+    try:
+      return self.bucket.blob(path).download_as_bytes()
+    except NotFound:
+      return None
+
+  def delete(self, path: str) -> None:
+    from google.api_core.exceptions import NotFound
+
+    try:
+      self.bucket.blob(path).delete()
+    except NotFound:
+      pass
+
+  def wait(self) -> None:
+    futures, self.futures = self.futures, []
+
+    errors = [future.exception() for future in futures if future.exception() is not None]
+
+    # it only holds the uploads that went through, so it is saved even when some failed
+    if self.manifest is not None:
+      self.manifest.save()
+
+    if errors:
+      raise RuntimeError('{0} of {1} uploads failed'.format(len(errors), len(futures))) from errors[0]
+
+  # content recorded under another digest has changed, anything else is asked of the bucket
+  def __unchanged(self, path: str, sha256: str) -> bool:
+    recorded = self.manifest.get(path) if self.manifest is not None else None
+    if recorded is not None and recorded != sha256:
+      return False
+
+    # one metadata request, None when the object does not exist
+    blob = self.bucket.get_blob(path)
+    return blob is not None and (blob.metadata or {}).get('sha256') == sha256
 
-    print(' Uploaded! {0}'.format(src))
+  def __record(self, path: str, sha256: str) -> None:
+    if self.manifest is not None:
+      self.manifest.put(path, sha256)
@@ -0,0 +1,58 @@
+import fcntl
+import json
+import os
+import threading
+
+# sha256 of every object this machine uploaded, by object path, persisted as JSON oldest first.
+#
+# Entries are only a hint, an object is skipped once the bucket confirms its digest.
+# Backfill days running in parallel processes share the file, so save() merges into it and
+# replaces it holding an exclusive lock on {path}.lock; past max_entries the oldest go.
+class UploadManifest:
+  def __init__(self, path: str, max_entries: int) -> None:
+    self.path = path
+    self.max_entries = max_entries
+    self.lock = threading.Lock()
+    self.digests = self.__read()
+    self.updated = {}
+
+  def get(self, object_path: str) -> str:
+    with self.lock:
+      return self.digests.get(object_path)
+
+  def put(self, object_path: str, sha256: str) -> None:
+    with self.lock:
+      self.digests[object_path] = sha256
+      self.updated[object_path] = sha256
+
+  def save(self) -> None:
+    with self.lock:
+      if not self.updated:
+        return
+
+      with open(f'{self.path}.lock', 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+
+        # merged into what is on disk now, updated entries move to the end
+        digests = self.__read()
+        for object_path, sha256 in self.updated.items():
+          digests.pop(object_path, None)
+          digests[object_path] = sha256
+
+        for object_path in list(digests)[:max(0, len(digests) - self.max_entries)]:
+          del digests[object_path]
+
+        # replace atomically so a failed write keeps the previous manifest
+        tmp_path = f'{self.path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as tmp_file:
+          json.dump(digests, tmp_file, indent=2)
+        os.replace(tmp_path, self.path)
+
+      self.updated = {}
+
+  def __read(self) -> dict:
+    if not os.path.exists(self.path):
+      return {}
+
+    with open(self.path) as json_file:
+      return json.load(json_file)
@@ -0,0 +1,11 @@
+#!/usr/bin/env python
+
+import sys
+
+from kw.main import backfill
+
+def run():
+  return backfill()
+
+if __name__ == '__main__':
+  sys.exit(run())
@@ -0,0 +1,11 @@
+#!/usr/bin/env python
+
+import sys
+
+from kw.benchmark.suite import run as run_benchmark
+
+def run():
+  run_benchmark()
+
+if __name__ == '__main__':
+  sys.exit(run())
@@ -0,0 +1,98 @@
+import copy
+import os
+import shutil
+import tempfile
+import unittest
+
+from kw.service.etl.change_index import ChangeIndex
+from kw.service.etl.flattener import Flattener
+from kw.service.etl.table_spec import TableSpec
+
+ACCOUNTS = TableSpec('accounts', '', record_path=['profile'], list_key='accounts', row_id=True, reindex=False)
+INVOICES = TableSpec(
+  'invoices', '', parent=ACCOUNTS, list_key='invoice', keys={'key_parent_id': 'key_id'}, reindex=False,
+)
+
+SPECS = [ACCOUNTS, INVOICES]
+
+DOCUMENTS = [
+  {'_id': 'a', 'profile': {'accounts': [{'no': 1, 'invoice': [{'amount': 5}, {'amount': 6}]}]}},
+  {'_id': 'b', 'profile': {'accounts': [{'no': 2, 'invoice': [{'amount': 7}]}, {'no': 3}]}},
+  {'_id': 'c', 'profile': {'accounts': [{'no': 4}]}},
+]
+
+class ChangeIndexTest(unittest.TestCase):
+  def setUp(self) -> None:
+    self.work_dir = tempfile.mkdtemp(prefix='kw-change-index-test-')
+    self.path = os.path.join(self.work_dir, 'changes.sqlite')
+
+  def tearDown(self) -> None:
+    shutil.rmtree(self.work_dir, ignore_errors=True)
+
+  def diff(self, documents: list) -> dict:
+    changes = ChangeIndex(self.path)
+    frames = Flattener(SPECS).flatten(documents)
+    diff = changes.diff(SPECS, frames, [document['_id'] for document in documents])
+    changes.commit()
+
+    # {table: (documents loaded, keys deleted)}
+    loaded = {}
+    for spec in SPECS:
+      df, deleted = diff[spec.name]
+      key_column = next(iter(spec.keys))
+      documents = df[key_column].str.rsplit('_', n=1).str[0]
+      loaded[spec.name] = (sorted(set(documents)), sorted(deleted[key_column]))
+
+    return loaded
+
+  def test_first_run_loads_every_document(self):
+    self.assertEqual(self.diff(DOCUMENTS), {
+      'accounts': (['a', 'b', 'c'], []),
+      'invoices': (['a', 'b', 'c'], []),
+    })
+
+  def test_unchanged_documents_load_nothing(self):
+    self.diff(DOCUMENTS)
+
+    self.assertEqual(self.diff(DOCUMENTS), {'accounts': ([], []), 'invoices': ([], [])})
+
+  def test_changed_child_row_reloads_the_document_in_every_table(self):
+    self.diff(DOCUMENTS)
+
+    documents = copy.deepcopy(DOCUMENTS)
+    documents[1]['profile']['accounts'][0]['invoice'][0]['amount'] = 8
+
+    self.assertEqual(self.diff(documents), {
+      'accounts': (['b'], ['b']),
+      'invoices': (['b'], ['b_1', 'b_2']),
+    })
+
+  def test_row_numbers_shifted_by_an_earlier_document_are_not_changes(self):
+    self.diff(DOCUMENTS)
+
+    documents = copy.deepcopy(DOCUMENTS)
+    documents[0]['profile']['accounts'].append({'no': 9})
+
+    # b and c are numbered after a's new row, their rows are still the same
+    self.assertEqual(self.diff(documents), {
+      'accounts': (['a'], ['a']),
+      'invoices': (['a'], ['a_0']),
+    })
+
+  def test_child_table_listing_key_request_id_goes_by_its_parent_keys(self):
+    frames = Flattener(SPECS).flatten(DOCUMENTS)
+    # reindexed to a schema listing key_request_id, which child rows do not fill
+    frames['invoices'] = frames['invoices'].assign(key_request_id=None)
+
+    diff = ChangeIndex(self.path).diff(SPECS, frames, ['a', 'b', 'c'])
+
+    self.assertEqual(len(diff['invoices'][0].index), len(frames['invoices'].index))
+
+  def test_uncommitted_diff_is_compared_again(self):
+    changes = ChangeIndex(self.path)
+    changes.diff(SPECS, Flattener(SPECS).flatten(DOCUMENTS), ['a', 'b', 'c'])
+
+    self.assertEqual(self.diff(DOCUMENTS)['accounts'], (['a', 'b', 'c'], []))
+
+if __name__ == '__main__':
+  unittest.main()
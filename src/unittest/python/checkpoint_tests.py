@@ -0,0 +1,56 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from bson import ObjectId
+from datetime import datetime
+from kw.service.etl.checkpoint import Checkpoint
+
+class CheckpointTest(unittest.TestCase):
+  def setUp(self) -> None:
+    self.work_dir = tempfile.mkdtemp(prefix='kw-checkpoint-test-')
+    self.path = os.path.join(self.work_dir, 'checkpoint.json')
+
+  def tearDown(self) -> None:
+    shutil.rmtree(self.work_dir, ignore_errors=True)
+
+  def test_missing_state_is_none(self):
+    self.assertIsNone(Checkpoint(self.path).get('20240101'))
+
+  def test_put_then_get_round_trips(self):
+    watermark = (datetime(2024, 1, 1, 12, 30, 15, 250000), ObjectId('65920a7f0000000000000001'))
+
+    counts = {'decision': {'total_records': 1500}}
+
+    Checkpoint(self.path).put('20240101', watermark, 3, counts)
+
+    self.assertEqual(Checkpoint(self.path).get('20240101'), {'watermark': watermark, 'part': 3, 'counts': counts})
+
+  def test_state_saved_without_counts_has_none(self):
+    Checkpoint(self.path).put('20240101', (datetime(2024, 1, 1, 23), ObjectId('65920a7f0000000000000001')), 1)
+
+    self.assertIsNone(Checkpoint(self.path).get('20240101')['counts'])
+
+  def test_days_keep_their_own_state(self):
+    checkpoint = Checkpoint(self.path)
+    checkpoint.put('20240101', (datetime(2024, 1, 1, 23), ObjectId('65920a7f0000000000000001')), 1)
+    checkpoint.put('20240102', (datetime(2024, 1, 2, 23), ObjectId('65920a7f0000000000000002')), 2)
+    checkpoint.put('20240101', (datetime(2024, 1, 1, 23, 30), ObjectId('65920a7f0000000000000003')), 4)
+
+    self.assertEqual(checkpoint.get('20240101')['part'], 4)
+    self.assertEqual(checkpoint.get('20240102')['part'], 2)
+    self.assertEqual(os.listdir(self.work_dir).count('checkpoint.json'), 1)
+    self.assertEqual([name for name in os.listdir(self.work_dir) if name.endswith('.tmp')], [])
+
+  def test_shards_keep_their_own_state(self):
+    checkpoint = Checkpoint(self.path)
+    checkpoint.put('20240101.shard0of2', (datetime(2024, 1, 1, 23), ObjectId('65920a7f0000000000000001')), 1)
+    checkpoint.put('20240101.shard1of2', (datetime(2024, 1, 1, 22), ObjectId('65920a7f0000000000000002')), 2)
+
+    self.assertEqual(checkpoint.get('20240101.shard0of2')['part'], 1)
+    self.assertEqual(checkpoint.get('20240101.shard1of2')['part'], 2)
+    self.assertIsNone(checkpoint.get('20240101'))
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,118 @@
+import contextlib
+import glob
+import io
+import os
+import shutil
+import tempfile
+import unittest
+import pandas as pd
+
+from datetime import datetime, timezone
+from unittest import mock
+from kw.benchmark.generator import DocumentGenerator
+from kw.benchmark.local_collection import LocalCollection
+from kw.benchmark.local_storage import LocalStorage
+from kw.benchmark.schemas import write_schemas
+from kw.service.etl.etl import ETL
+from kw.service.etl.extractor import Extractor
+from kw.service.etl.tables import TABLES, table_specs
+
+START = datetime(2024, 1, 1)
+END = datetime.combine(START.date(), datetime.max.time())
+
+# the stand-in bucket the runs upload to, under the scratch directory
+BUCKET_ROOT = 'bucket'
+
+def utc(value: datetime) -> datetime:
+  # pymongo hands back naive UTC datetimes
+  return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+def generate_documents(count: int=200, start_datetime: datetime=START, end_datetime: datetime=END) -> list:
+  return DocumentGenerator(fan_out=4).documents(count, utc(start_datetime), utc(end_datetime))
+
+# Runs the ETL over generated documents in a scratch directory, with Mongo and GCS replaced
+# by the benchmark's in-process stand-ins. Schema files are generated from the documents.
+class EtlTestCase(unittest.TestCase):
+  # variables a test case sets for all of its runs
+  environ = {}
+
+  def setUp(self) -> None:
+    self.cwd = os.getcwd()
+    self.work_dir = tempfile.mkdtemp(prefix='kw-etl-test-')
+    os.chdir(self.work_dir)
+
+    self.patched_environ = mock.patch.dict(os.environ, {
+      'METRICS_PATH': '', 'METRICS_PROM_PATH': '', 'LOAD_SINK': 'disk', 'LOAD_FORMAT': 'csv',
+      'LOAD_COMPRESSION': '', 'LOAD_MAX_PART_ROWS': '0', 'LOAD_MAX_PART_MB': '0',
+      'CDC_INDEX_PATH': '', 'ETL_MEMORY_BUDGET_MB': '0',
+      'EXTRACT_CHECKPOINT_PATH': os.path.join(self.work_dir, 'checkpoint.json'),
+      **type(self).environ,
+    })
+    self.patched_environ.start()
+
+    self.documents = generate_documents()
+    write_schemas(table_specs(list(TABLES)), self.documents)
+
+  def tearDown(self) -> None:
+    self.patched_environ.stop()
+    os.chdir(self.cwd)
+    shutil.rmtree(self.work_dir, ignore_errors=True)
+
+  def run_etl(self, documents: list=None, **kwargs) -> ETL:
+    documents = self.documents if documents is None else documents
+    kwargs.setdefault('tables', list(TABLES))
+
+    etl = ETL(
+      START, END, 'kw', extractor=Extractor(db_collection=LocalCollection(documents)),
+      storage=LocalStorage(BUCKET_ROOT), **kwargs,
+    )
+    # the run's summary is not part of the test output
+    with contextlib.redirect_stdout(io.StringIO()):
+      etl.run()
+
+    return etl
+
+  # {path under the bucket: content} of every uploaded file
+  def bucket_files(self, pattern: str='**') -> dict:
+    files = {}
+    for path in sorted(glob.glob(os.path.join(BUCKET_ROOT, pattern), recursive=True)):
+      if os.path.isfile(path):
+        with open(path, 'rb') as f:
+          files[os.path.relpath(path, BUCKET_ROOT)] = f.read()
+
+    return files
+
+  def clear_bucket(self) -> None:
+    shutil.rmtree(BUCKET_ROOT, ignore_errors=True)
+    shutil.rmtree('kw', ignore_errors=True)
+
+  # [(digest, filename)] and counts of a table's manifest
+  def manifest(self, table_name: str, shard: int=None) -> tuple:
+    suffix = 'sha256' if shard is None else f'shard{shard}.sha256'
+    path = os.path.join(BUCKET_ROOT, 'kw', table_name, str(START.year), f'{table_name}_{START:%Y%m%d}.{suffix}')
+
+    records = []
+    counts = {}
+    with open(path) as f:
+      for line in f.read().splitlines():
+        key, value = line.split(' ', 1)
+        if key.endswith('_records'):
+          counts[key] = int(value)
+        else:
+          records.append((key, value))
+
+    return records, counts
+
+  # rows of the data files a table's manifest lists, as the strings written
+  def table_rows(self, table_name: str, shard: int=None) -> pd.DataFrame:
+    directory = os.path.join(BUCKET_ROOT, 'kw', table_name, str(START.year))
+    frames = [
+      pd.read_csv(os.path.join(directory, filename), dtype=str, keep_default_na=False)
+      for _, filename in self.manifest(table_name, shard)[0]
+      if filename.startswith(f'{table_name}_{START:%Y%m%d}_')
+    ]
+
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+  def total_records(self) -> int:
+    return sum(self.manifest(spec.name)[1]['total_records'] for spec in table_specs(list(TABLES)))
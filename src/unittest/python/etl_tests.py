@@ -0,0 +1,186 @@
+import copy
+import os
+import unittest
+
+from unittest import mock
+from etl_fixtures import BUCKET_ROOT, START, EtlTestCase
+from kw.benchmark.local_storage import LocalStorage
+from kw.service.etl.checkpoint import Checkpoint
+from kw.service.etl.loader import Loader
+from kw.service.etl.tables import TABLES, table_specs
+
+TABLE_NAMES = [spec.name for spec in table_specs(list(TABLES))]
+
+class EtlTest(EtlTestCase):
+  def test_every_table_is_written(self):
+    self.run_etl()
+
+    for table_name in TABLE_NAMES:
+      records, counts = self.manifest(table_name)
+      self.assertEqual(len(self.table_rows(table_name).index), counts['total_records'], table_name)
+
+    self.assertEqual(self.manifest('decision')[1], {'total_records': len(self.documents)})
+
+  def test_batches_write_the_files_of_one_batch(self):
+    self.run_etl()
+    expected = self.bucket_files()
+
+    for batch_size in [37, 70]:
+      self.clear_bucket()
+      self.run_etl(batch_size=batch_size)
+
+      self.assertEqual(self.bucket_files(), expected, batch_size)
+
+  def test_workers_write_the_files_of_one_worker(self):
+    self.run_etl()
+    expected = self.bucket_files()
+
+    self.clear_bucket()
+    self.run_etl(workers=4)
+
+    self.assertEqual(self.bucket_files(), expected)
+
+  def test_spilled_frames_write_the_same_files(self):
+    self.run_etl()
+    expected = self.bucket_files()
+
+    self.clear_bucket()
+    # any process is over a 1 MB budget, every frame waits on disk
+    with mock.patch.dict(os.environ, {'ETL_MEMORY_BUDGET_MB': '1', 'ETL_SPILL_DIR': 'spill'}):
+      etl = self.run_etl(batch_size=70)
+
+    self.assertEqual(self.bucket_files(), expected)
+    self.assertIn('spill', [record['step'] for record in etl.metrics.records])
+    self.assertEqual(os.listdir('spill'), [])
+
+  def test_selected_tables_only(self):
+    self.run_etl(tables=['tdg'])
+
+    self.assertEqual(sorted(os.listdir(os.path.join(BUCKET_ROOT, 'kw'))), ['tdg', 'tdg_results', 'tdg_results_product_scores'])
+
+  def test_incremental_runs_add_up_to_a_full_run(self):
+    self.run_etl()
+    expected = {table_name: self.manifest(table_name)[1] for table_name in TABLE_NAMES}
+    expected_decisions = self.table_rows('decision')
+
+    self.clear_bucket()
+    half = len(self.documents) // 2
+    self.run_etl(self.documents[:half], incremental=True)
+    self.run_etl(incremental=True)
+
+    self.assertEqual({table_name: self.manifest(table_name)[1] for table_name in TABLE_NAMES}, expected)
+    self.assertEqual(
+      [filename for _, filename in self.manifest('decision')[0]],
+      ['decision_20240101_1.csv', 'decision_20240101_2.csv', 'decision_20240101.schema'],
+    )
+    self.assertTrue(self.table_rows('decision').equals(expected_decisions))
+
+  def test_retried_incremental_run_lists_its_part_once(self):
+    self.run_etl()
+    expected = {table_name: self.manifest(table_name)[1] for table_name in TABLE_NAMES}
+
+    self.clear_bucket()
+    half = len(self.documents) // 2
+    self.run_etl(self.documents[:half], incremental=True)
+
+    # the manifests are written, then the run fails saving its checkpoint
+    with mock.patch.object(Checkpoint, 'put', side_effect=OSError('disk full')):
+      with self.assertRaises(OSError):
+        self.run_etl(incremental=True)
+    self.run_etl(incremental=True)
+
+    self.assertEqual({table_name: self.manifest(table_name)[1] for table_name in TABLE_NAMES}, expected)
+    self.assertEqual(
+      [filename for _, filename in self.manifest('decision')[0]],
+      ['decision_20240101_1.csv', 'decision_20240101_2.csv', 'decision_20240101.schema'],
+    )
+
+  def test_incremental_run_without_new_documents_keeps_the_manifest(self):
+    self.run_etl(incremental=True)
+    expected = self.bucket_files()
+
+    self.run_etl(incremental=True)
+
+    self.assertEqual(self.bucket_files(), expected)
+
+  def test_first_change_capture_run_loads_every_row(self):
+    self.run_etl()
+    expected = self.bucket_files()
+
+    self.clear_bucket()
+    with mock.patch.dict(os.environ, {'CDC_INDEX_PATH': 'changes.sqlite'}):
+      self.run_etl()
+
+    # the manifests add deleted_records 0
+    self.assertEqual(self.bucket_files('**/*.csv'), {
+      path: content for path, content in expected.items() if path.endswith('.csv')
+    })
+
+  def test_change_capture_reruns_add_parts_to_the_day(self):
+    documents = copy.deepcopy(self.documents)
+    documents[1]['channel'] = 'changed'
+
+    for batch_size in [0, 70]:
+      with self.subTest(batch_size=batch_size):
+        self.clear_bucket()
+        for path in ['changes.sqlite', os.environ['EXTRACT_CHECKPOINT_PATH']]:
+          if os.path.exists(path):
+            os.remove(path)
+
+        with mock.patch.dict(os.environ, {'CDC_INDEX_PATH': 'changes.sqlite'}):
+          self.run_etl(batch_size=batch_size)
+          first = self.bucket_files('**/*.csv')
+          self.run_etl(batch_size=batch_size)
+          self.run_etl(documents, batch_size=batch_size)
+
+        # the earlier files are kept as they were and still listed
+        files = self.bucket_files('**/*.csv')
+        self.assertEqual({path: files.get(path) for path in first}, first)
+
+        records, counts = self.manifest('decision')
+        self.assertEqual([filename for _, filename in records], [
+          'decision_20240101_1.csv',
+          'decision_20240101_3.csv',
+          'decision_20240101.deletes_3.csv',
+          'decision_20240101.schema',
+        ])
+        self.assertEqual(counts, {'deleted_records': 1, 'total_records': len(self.documents) + 1})
+        self.assertEqual(list(self.table_rows('decision')['channel'][-1:]), ['changed'])
+
+  def test_shards_add_up_to_a_full_run(self):
+    self.run_etl()
+    expected = {table_name: self.manifest(table_name)[1] for table_name in TABLE_NAMES}
+    expected_decisions = self.table_rows('decision')
+
+    self.clear_bucket()
+    for index in range(3):
+      self.run_etl(shard=(index, 3))
+    Loader('kw', START, storage=LocalStorage(BUCKET_ROOT)).merge_shards(TABLE_NAMES, 3)
+
+    self.assertEqual({table_name: self.manifest(table_name)[1] for table_name in TABLE_NAMES}, expected)
+
+    decisions = self.table_rows('decision')
+    self.assertEqual(sorted(decisions['_id']), sorted(expected_decisions['_id']))
+    self.assertTrue(
+      decisions.sort_values('_id', ignore_index=True).equals(expected_decisions.sort_values('_id', ignore_index=True))
+    )
+
+  def test_incremental_shards_keep_their_own_checkpoint(self):
+    self.run_etl()
+    expected = {table_name: self.manifest(table_name)[1] for table_name in TABLE_NAMES}
+
+    self.clear_bucket()
+    half = len(self.documents) // 2
+    for documents in [self.documents[:half], self.documents]:
+      for index in range(2):
+        self.run_etl(documents, incremental=True, shard=(index, 2))
+    Loader('kw', START, storage=LocalStorage(BUCKET_ROOT)).merge_shards(TABLE_NAMES, 2)
+
+    self.assertEqual({table_name: self.manifest(table_name)[1] for table_name in TABLE_NAMES}, expected)
+    self.assertEqual(
+      [filename for _, filename in self.manifest('decision', shard=0)[0]],
+      ['decision_20240101_shard0_1.csv', 'decision_20240101_shard0_2.csv', 'decision_20240101.schema'],
+    )
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,93 @@
+import json
+import unittest
+import pandas as pd
+
+from kw.service.etl.flattener import Flattener
+from kw.service.etl.table_spec import TableSpec
+
+PROFILE = TableSpec('profile', '', record_path=['profile'], reindex=False)
+ACCOUNTS = TableSpec('accounts', '', record_path=['profile'], list_key='accounts', row_id=True, reindex=False)
+INVOICES = TableSpec(
+  'invoices', '', parent=ACCOUNTS, list_key='invoice', keys={'key_parent_id': 'key_id'}, reindex=False,
+)
+SCORES = TableSpec('scores', '', record_path=['profile'], json_key='scores', reindex=False)
+
+SPECS = [PROFILE, ACCOUNTS, INVOICES, SCORES]
+
+DOCUMENTS = [
+  {'_id': 'a', 'profile': {
+    'name': 'x', 'address': {'city': 'bkk'}, 'scores': {'tdg': 1},
+    'accounts': [{'no': 1, 'invoice': [{'amount': 5}, {'amount': 6}]}, {'no': 2, 'invoice': []}],
+  }},
+  {'_id': 'b', 'profile': {'name': 'y', 'accounts': []}},
+  {'_id': 'c'},
+  {'_id': 'd', 'profile': {'name': 'z', 'accounts': [{'no': 3, 'invoice': [{'amount': 7}]}]}},
+]
+
+# the list table as exploding the json_normalize frame built it before the flattener
+def exploded(documents: list, list_path: str) -> pd.DataFrame:
+  df = pd.json_normalize(documents, sep='->')
+  df['key_request_id'] = df['_id']
+
+  df = df.reindex(columns=['key_request_id', list_path]).explode(list_path)
+  df[list_path] = df[list_path].map(lambda value: value if isinstance(value, dict) else {})
+  df.reset_index(drop=True, inplace=True)
+  df = df.join(pd.json_normalize(df[list_path].tolist(), sep='->')).drop(columns=[list_path])
+  df.columns = df.columns.str.replace('->', '_')
+
+  return df
+
+class FlattenerTest(unittest.TestCase):
+  def test_obj_table_flattens_sub_documents(self):
+    df = Flattener(SPECS).flatten(DOCUMENTS)['profile']
+
+    self.assertEqual(list(df['key_request_id']), ['a', 'b', 'c', 'd'])
+    self.assertEqual(list(df['name'].fillna('')), ['x', 'y', '', 'z'])
+    self.assertEqual(df['address_city'][0], 'bkk')
+
+  def test_list_rows_number_key_id_over_all_documents(self):
+    df = Flattener(SPECS).flatten(DOCUMENTS)['accounts']
+
+    # parents without elements keep a placeholder row
+    self.assertEqual(list(df['key_id']), ['a_0', 'a_1', 'b_2', 'c_3', 'd_4'])
+    self.assertEqual(list(df['no'].fillna(0)), [1, 2, 0, 0, 3])
+
+  def test_child_rows_refer_to_parent_key_id(self):
+    df = Flattener(SPECS).flatten(DOCUMENTS)['invoices']
+
+    self.assertEqual(list(df.columns), ['key_parent_id', 'amount'])
+    self.assertEqual(list(df['key_parent_id']), ['a_0', 'a_0', 'a_1', 'b_2', 'c_3', 'd_4'])
+    self.assertEqual(list(df['amount'].fillna(0)), [5, 6, 0, 0, 0, 7])
+
+  def test_json_table_dumps_sub_document(self):
+    df = Flattener(SPECS).flatten(DOCUMENTS)['scores']
+
+    self.assertEqual([json.loads(value) for value in df['scores']], [{'tdg': 1}, None, None, None])
+
+  def test_list_table_matches_exploded_frame(self):
+    df = Flattener(SPECS).flatten(DOCUMENTS)['accounts'].drop(columns=['key_id', 'invoice'])
+    expected = exploded(DOCUMENTS, 'profile->accounts').drop(columns=['invoice'])
+
+    pd.testing.assert_frame_equal(df, expected[list(df.columns)], check_dtype=False)
+
+  def test_walks_in_batches_number_rows_like_one_walk(self):
+    expected = Flattener(SPECS).flatten(DOCUMENTS)
+
+    flattener = Flattener(SPECS)
+    batches = [dict(flattener.frames(flattener.walk(DOCUMENTS[i:i + 2]))) for i in range(0, len(DOCUMENTS), 2)]
+
+    for spec in SPECS:
+      df = pd.concat([batch[spec.name] for batch in batches], ignore_index=True)
+      pd.testing.assert_frame_equal(df, expected[spec.name], check_dtype=False)
+
+  def test_frames_drop_walked_rows(self):
+    flattener = Flattener(SPECS)
+    states = flattener.walk(DOCUMENTS)
+
+    names = [name for name, _ in flattener.frames(states)]
+
+    self.assertEqual(names, [spec.name for spec in SPECS])
+    self.assertEqual(states, {})
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,60 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+
+from unittest import mock
+from kw.service.etl.hasher import HashCache, Hasher
+
+def sha256(value) -> str:
+  return hashlib.sha256(str(value).encode('utf-8')).hexdigest()
+
+class HasherTest(unittest.TestCase):
+  def setUp(self) -> None:
+    self.work_dir = tempfile.mkdtemp(prefix='kw-hasher-test-')
+
+  def tearDown(self) -> None:
+    shutil.rmtree(self.work_dir, ignore_errors=True)
+
+  def test_hash_is_sha256_of_str_per_cell(self):
+    series = pd.Series(['0812345678', 'somchai', None, '0812345678'], name='mobile')
+
+    with mock.patch.dict(os.environ, {'HASH_CACHE_PATH': ''}):
+      hashed = Hasher().hash(series)
+
+    self.assertEqual(list(hashed), [sha256('0812345678'), sha256('somchai'), '', sha256('0812345678')])
+    self.assertEqual(hashed.name, 'mobile')
+
+  def test_mixed_values_hash_by_str(self):
+    series = pd.Series([1, '1', 1.5, np.nan], index=[3, 5, 7, 9])
+
+    with mock.patch.dict(os.environ, {'HASH_CACHE_PATH': ''}):
+      hashed = Hasher().hash(series)
+
+    self.assertEqual(list(hashed), [sha256(1), sha256('1'), sha256(1.5), ''])
+    self.assertEqual(list(hashed.index), [3, 5, 7, 9])
+
+  def test_cache_gives_same_digests(self):
+    series = pd.Series(['a', 'b', 'a'])
+    cache_path = os.path.join(self.work_dir, 'hashes.sqlite')
+
+    with mock.patch.dict(os.environ, {'HASH_CACHE_PATH': cache_path}):
+      first = Hasher().hash(series)
+      second = Hasher().hash(series)
+
+    self.assertEqual(list(first), [sha256('a'), sha256('b'), sha256('a')])
+    self.assertEqual(list(second), list(first))
+
+  def test_cache_drops_oldest_entries_over_its_bound(self):
+    cache = HashCache(os.path.join(self.work_dir, 'hashes.sqlite'), max_entries=2)
+
+    cache.put_many([('a', sha256('a')), ('b', sha256('b'))])
+    cache.put_many([('c', sha256('c'))])
+
+    self.assertEqual(cache.get_many(['a', 'b', 'c']), {'b': sha256('b'), 'c': sha256('c')})
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,190 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import unittest
+import pandas as pd
+
+from datetime import datetime
+from unittest import mock
+from kw.helper.metrics import Metrics
+from kw.service.etl.loader import Loader
+from kw.service.etl.sinks import LocalDirectorySink
+
+AS_OF = datetime(2024, 1, 1)
+
+SCHEMA = [
+  {'name': 'key_request_id', 'type': 'STRING', 'mode': 'NULLABLE'},
+  {'name': 'amount', 'type': 'INTEGER', 'mode': 'NULLABLE'},
+]
+
+class LoaderTest(unittest.TestCase):
+  def setUp(self) -> None:
+    self.cwd = os.getcwd()
+    self.work_dir = tempfile.mkdtemp(prefix='kw-loader-test-')
+    os.chdir(self.work_dir)
+
+    self.patched_environ = mock.patch.dict(os.environ, {
+      'METRICS_PATH': '', 'METRICS_PROM_PATH': '', 'LOAD_FORMAT': 'csv', 'LOAD_COMPRESSION': '',
+      'LOAD_MAX_PART_ROWS': '0', 'LOAD_MAX_PART_MB': '0',
+    })
+    self.patched_environ.start()
+
+    self.schema = 'table_schema.json'
+    with open(self.schema, 'w') as json_file:
+      json.dump(SCHEMA, json_file)
+
+    self.df = pd.DataFrame({'key_request_id': [f'r{i}' for i in range(5)], 'amount': range(5)})
+
+  def tearDown(self) -> None:
+    self.patched_environ.stop()
+    os.chdir(self.cwd)
+    shutil.rmtree(self.work_dir, ignore_errors=True)
+
+  def loader(self, **kwargs) -> Loader:
+    return Loader('kw', AS_OF, metrics=Metrics(), sink=LocalDirectorySink('bucket'), **kwargs)
+
+  def read(self, filename: str) -> bytes:
+    with open(os.path.join('bucket/kw/table/2024', filename), 'rb') as f:
+      return f.read()
+
+  def manifest(self, filename: str='table_20240101.sha256') -> list:
+    return self.read(filename).decode('utf-8').splitlines()
+
+  def record(self, filename: str) -> str:
+    return f'{hashlib.sha256(self.read(filename)).hexdigest()} {filename}'
+
+  def test_manifest_lists_data_schema_and_total_records(self):
+    loader = self.loader()
+    loader.load(self.df, self.schema, 'table')
+    loader.close()
+
+    self.assertEqual(self.manifest(), [
+      self.record('table_20240101_1.csv'),
+      self.record('table_20240101.schema'),
+      'total_records 5',
+    ])
+    self.assertEqual(loader.last_part, 1)
+
+  def test_max_part_rows_splits_the_table(self):
+    with mock.patch.dict(os.environ, {'LOAD_MAX_PART_ROWS': '2'}):
+      loader = self.loader()
+    loader.load(self.df, self.schema, 'table')
+    loader.close()
+
+    self.assertEqual(self.manifest(), [
+      self.record('table_20240101_1.csv'),
+      self.record('table_20240101_2.csv'),
+      self.record('table_20240101_3.csv'),
+      self.record('table_20240101.schema'),
+      'total_records 5',
+    ])
+    self.assertEqual(loader.last_part, 3)
+
+    # every part is a whole CSV file with its own header line
+    parts = [self.read(f'table_20240101_{part}.csv').decode('utf-8').splitlines() for part in [1, 2, 3]]
+    self.assertEqual([lines[0] for lines in parts], ['key_request_id,amount'] * 3)
+    self.assertEqual(sum([lines[1:] for lines in parts], []), [f'r{i},{i}' for i in range(5)])
+
+  def test_streamed_batches_split_like_one_frame(self):
+    with mock.patch.dict(os.environ, {'LOAD_MAX_PART_ROWS': '2'}):
+      loader = self.loader()
+      streaming_loader = Loader('kw', AS_OF, streaming=True, metrics=Metrics(), sink=LocalDirectorySink('streamed'))
+
+    loader.load(self.df, self.schema, 'table')
+    loader.close()
+    for start in range(0, 5, 3):
+      streaming_loader.load(self.df.iloc[start:start + 3], self.schema, 'table')
+    streaming_loader.close()
+
+    for part in [1, 2, 3]:
+      with open(f'streamed/kw/table/2024/table_20240101_{part}.csv', 'rb') as f:
+        self.assertEqual(f.read(), self.read(f'table_20240101_{part}.csv'))
+
+  def test_incremental_part_extends_the_manifest(self):
+    loader = self.loader()
+    loader.load(self.df.iloc[:3], self.schema, 'table')
+    loader.close()
+
+    loader = self.loader(part=2)
+    loader.load(self.df.iloc[3:], self.schema, 'table', deleted=pd.DataFrame({'key_request_id': ['r0']}))
+    loader.close()
+
+    self.assertEqual(self.manifest(), [
+      self.record('table_20240101_1.csv'),
+      self.record('table_20240101_2.csv'),
+      self.record('table_20240101.deletes_2.csv'),
+      self.record('table_20240101.schema'),
+      'deleted_records 1',
+      'total_records 5',
+    ])
+
+  def test_retried_part_replaces_the_failed_attempt(self):
+    loader = self.loader()
+    loader.load(self.df.iloc[:3], self.schema, 'table')
+    loader.close()
+
+    # the attempt wrote its manifest, but the run failed before the checkpoint was saved
+    loader = self.loader(part=2, earlier_counts={'table': {'total_records': 3}})
+    loader.load(self.df.iloc[3:4], self.schema, 'table')
+    loader.close()
+
+    loader = self.loader(part=2, earlier_counts={'table': {'total_records': 3}})
+    loader.load(self.df.iloc[3:], self.schema, 'table')
+    loader.close()
+
+    self.assertEqual(self.manifest(), [
+      self.record('table_20240101_1.csv'),
+      self.record('table_20240101_2.csv'),
+      self.record('table_20240101.schema'),
+      'total_records 5',
+    ])
+    self.assertEqual(loader.counts, {'table': {'total_records': 5}})
+
+  def test_failed_run_leaves_the_manifest(self):
+    loader = self.loader()
+    loader.load(self.df.iloc[:3], self.schema, 'table')
+    loader.close()
+    expected = self.manifest()
+
+    loader = self.loader(part=2)
+    loader.load(self.df.iloc[3:], self.schema, 'table')
+    loader.abort()
+
+    self.assertEqual(self.manifest(), expected)
+
+  def test_merge_shards_lists_every_shard_in_order(self):
+    for shard, df in enumerate([self.df.iloc[:2], self.df.iloc[2:]]):
+      loader = self.loader(shard=shard)
+      loader.load(df, self.schema, 'table')
+      loader.close()
+
+    self.loader().merge_shards(['table'], 2)
+
+    self.assertEqual(self.manifest(), [
+      self.record('table_20240101_shard0_1.csv'),
+      self.record('table_20240101_shard1_1.csv'),
+      self.record('table_20240101.schema'),
+      'total_records 5',
+    ])
+    self.assertEqual(self.manifest('table_20240101.shard1.sha256')[-1], 'total_records 3')
+
+  def test_merge_shards_fails_on_a_missing_shard(self):
+    loader = self.loader(shard=0)
+    loader.load(self.df, self.schema, 'table')
+    loader.close()
+
+    with self.assertRaisesRegex(RuntimeError, 'shard 1 of 2'):
+      self.loader().merge_shards(['table'], 2)
+
+  def test_abort_discards_open_parts(self):
+    loader = Loader('kw', AS_OF, streaming=True, metrics=Metrics(), sink=LocalDirectorySink('bucket'))
+    loader.load(self.df, self.schema, 'table')
+    loader.abort()
+
+    self.assertFalse(os.path.exists('bucket/kw/table/2024/table_20240101_1.csv'))
+    self.assertFalse(os.path.exists('bucket/kw/table/2024/table_20240101.sha256'))
+
+if __name__ == '__main__':
+  unittest.main()
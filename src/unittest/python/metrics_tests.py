@@ -0,0 +1,68 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from datetime import date
+from unittest import mock
+from kw.helper.metrics import Metrics, export_backfill
+
+class MetricsTest(unittest.TestCase):
+  def setUp(self) -> None:
+    self.work_dir = tempfile.mkdtemp(prefix='kw-metrics-test-')
+    self.patched_environ = mock.patch.dict(os.environ, {
+      'METRICS_PATH': os.path.join(self.work_dir, 'metrics.jsonl'),
+      'METRICS_PROM_PATH': os.path.join(self.work_dir, 'metrics.prom'),
+    })
+    self.patched_environ.start()
+
+  def tearDown(self) -> None:
+    self.patched_environ.stop()
+    shutil.rmtree(self.work_dir, ignore_errors=True)
+
+  def read(self, filename: str) -> str:
+    with open(os.path.join(self.work_dir, filename)) as f:
+      return f.read()
+
+  def export(self, as_of: str, **kwargs) -> None:
+    metrics = Metrics(labels={'as_of': as_of}, **kwargs)
+    with metrics.measure('extract') as record:
+      record['rows'] = 10
+    metrics.export()
+
+  def test_runs_of_other_days_replace_the_file(self):
+    self.export('20240101')
+    self.export('20240102')
+
+    self.assertEqual(sorted(os.listdir(self.work_dir)), ['metrics.jsonl', 'metrics.prom'])
+    self.assertIn('kw_etl_step_rows{as_of="20240102",step="extract",table=""} 10', self.read('metrics.prom'))
+    self.assertNotIn('20240101', self.read('metrics.prom'))
+
+    # the JSON lines keep every run
+    as_ofs = [json.loads(line)['as_of'] for line in self.read('metrics.jsonl').splitlines()]
+    self.assertEqual(as_ofs, ['20240101', '20240102'])
+
+  def test_slot_has_a_file_of_its_own(self):
+    self.export('20240101')
+    self.export('20240101', slot='shard1')
+
+    self.assertIn('kw_etl_run_success{as_of="20240101"} 1', self.read('metrics_shard1.prom'))
+    self.assertTrue(os.path.exists(os.path.join(self.work_dir, 'metrics.prom')))
+
+  def test_prometheus_off_writes_json_lines_only(self):
+    self.export('20240101', prometheus=False)
+
+    self.assertEqual(os.listdir(self.work_dir), ['metrics.jsonl'])
+
+  def test_backfill_exports_one_file_for_its_days(self):
+    export_backfill({date(2024, 1, 2): (12.5, "ValueError('x')"), date(2024, 1, 1): (10.0, None)})
+
+    lines = self.read('metrics_backfill.prom').splitlines()
+    self.assertIn('kw_etl_backfill_day_seconds{as_of="20240101"} 10.0', lines)
+    self.assertIn('kw_etl_backfill_day_success{as_of="20240101"} 1', lines)
+    self.assertIn('kw_etl_backfill_day_success{as_of="20240102"} 0', lines)
+    self.assertEqual(sorted(os.listdir(self.work_dir)), ['metrics_backfill.prom'])
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,53 @@
+import threading
+import unittest
+
+from kw.service.etl.scheduler import Scheduler
+
+class SchedulerTest(unittest.TestCase):
+  def tasks(self, ran: list, fail: str=None) -> dict:
+    lock = threading.Lock()
+
+    def task(name):
+      def run():
+        if name == fail:
+          raise RuntimeError(name)
+        with lock:
+          ran.append(name)
+      return run
+
+    return {
+      'load_b': (task('load_b'), ['frame']),
+      'frame': (task('frame'), []),
+      'load_a': (task('load_a'), ['frame']),
+      'merge': (task('merge'), ['load_a', 'load_b']),
+    }
+
+  def test_serial_runs_dependencies_first(self):
+    ran = []
+    Scheduler(workers=1).run(self.tasks(ran))
+
+    self.assertEqual(ran, ['frame', 'load_b', 'load_a', 'merge'])
+
+  def test_parallel_runs_every_task_after_its_dependencies(self):
+    ran = []
+    Scheduler(workers=4).run(self.tasks(ran))
+
+    self.assertEqual(ran[0], 'frame')
+    self.assertEqual(ran[-1], 'merge')
+    self.assertEqual(sorted(ran), ['frame', 'load_a', 'load_b', 'merge'])
+
+  def test_failed_task_stops_its_dependents(self):
+    for workers in [1, 4]:
+      ran = []
+      with self.assertRaisesRegex(RuntimeError, 'load_a'):
+        Scheduler(workers=workers).run(self.tasks(ran, fail='load_a'))
+
+      self.assertNotIn('merge', ran)
+
+  def test_unresolvable_dependencies_raise(self):
+    for workers in [1, 4]:
+      with self.assertRaisesRegex(ValueError, 'load'):
+        Scheduler(workers=workers).run({'load': (lambda: None, ['missing'])})
+
+if __name__ == '__main__':
+  unittest.main()
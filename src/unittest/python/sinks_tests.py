@@ -0,0 +1,89 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import unittest
+
+from kw.benchmark.local_storage import LocalStorage
+from kw.helper.hashing_writer import HashingWriter
+from kw.service.etl.sinks import DiskSink, LocalDirectorySink, StorageSink
+
+class SinksTest(unittest.TestCase):
+  def setUp(self) -> None:
+    self.cwd = os.getcwd()
+    self.work_dir = tempfile.mkdtemp(prefix='kw-sinks-test-')
+    os.chdir(self.work_dir)
+
+  def tearDown(self) -> None:
+    os.chdir(self.cwd)
+    shutil.rmtree(self.work_dir, ignore_errors=True)
+
+  def write(self, sink, path: str, content: bytes) -> None:
+    stream = HashingWriter(sink.open(path, 'table'))
+    stream.write(content)
+    stream.close()
+
+  def test_disk_sink_uploads_closed_files(self):
+    storage = LocalStorage('bucket')
+    sink = DiskSink(storage)
+
+    self.write(sink, 'kw/table/2024/table_20240101_1.csv', b'a,b\n1,2\n')
+    sink.wait()
+
+    self.assertEqual(storage.download('kw/table/2024/table_20240101_1.csv'), b'a,b\n1,2\n')
+    self.assertEqual(sink.read('kw/table/2024/table_20240101_1.csv'), b'a,b\n1,2\n')
+
+  def test_disk_sink_skips_content_the_bucket_holds(self):
+    storage = LocalStorage('bucket')
+    sink = DiskSink(storage)
+
+    self.write(sink, 'kw/table/2024/table_20240101_1.csv', b'a,b\n1,2\n')
+    self.write(sink, 'kw/table/2024/table_20240101_1.csv', b'a,b\n1,2\n')
+
+    self.assertEqual((storage.uploaded_files, storage.skipped_files), (1, 1))
+
+  def test_disk_sink_reads_files_of_other_machines_from_the_bucket(self):
+    storage = LocalStorage('bucket')
+    os.makedirs('bucket/kw/table/2024')
+    with open('bucket/kw/table/2024/table_20240101.shard1.sha256', 'wb') as f:
+      f.write(b'manifest')
+
+    self.assertEqual(DiskSink(storage).read('kw/table/2024/table_20240101.shard1.sha256'), b'manifest')
+
+  def test_aborted_files_are_removed(self):
+    storage = LocalStorage('bucket')
+
+    for sink, path in [
+      (DiskSink(storage), 'kw/table/2024/table_20240101_1.csv'),
+      (StorageSink(storage), 'kw/table/2024/table_20240101_2.csv'),
+      (LocalDirectorySink('output'), 'kw/table/2024/table_20240101_3.csv'),
+    ]:
+      stream = sink.open(path, 'table')
+      stream.write(b'partial')
+      stream.abort()
+      # a wrapper closing the aborted stream afterwards does not commit it
+      stream.close()
+
+      self.assertIsNone(sink.read(path) if not isinstance(sink, DiskSink) else storage.download(path))
+      self.assertFalse(os.path.exists(path))
+
+  def test_storage_sink_streams_into_the_bucket(self):
+    storage = LocalStorage('bucket')
+    sink = StorageSink(storage)
+
+    self.write(sink, 'kw/table/2024/table_20240101_1.csv', b'a,b\n')
+
+    self.assertEqual(sink.read('kw/table/2024/table_20240101_1.csv'), b'a,b\n')
+    self.assertFalse(os.path.exists('kw'))
+
+  def test_local_directory_sink_writes_under_its_root(self):
+    sink = LocalDirectorySink('output')
+
+    self.write(sink, 'kw/table/2024/table_20240101_1.csv', b'a,b\n')
+
+    with open('output/kw/table/2024/table_20240101_1.csv', 'rb') as f:
+      self.assertEqual(hashlib.sha256(f.read()).hexdigest(), hashlib.sha256(b'a,b\n').hexdigest())
+    self.assertIsNone(sink.read('kw/table/2024/missing.csv'))
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,72 @@
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+import unittest
+
+from kw.service.gcs.upload_manifest import UploadManifest
+
+def save_entries(path: str, worker: int, count: int) -> None:
+  for i in range(count):
+    manifest = UploadManifest(path, max_entries=1000)
+    manifest.put(f'kw/table/2024/table_2024010{worker}_{i}.csv', f'{worker}{i}')
+    manifest.save()
+
+class UploadManifestTest(unittest.TestCase):
+  def setUp(self) -> None:
+    self.work_dir = tempfile.mkdtemp(prefix='kw-upload-manifest-test-')
+    self.path = os.path.join(self.work_dir, 'upload_manifest.json')
+
+  def tearDown(self) -> None:
+    shutil.rmtree(self.work_dir, ignore_errors=True)
+
+  def test_saved_entries_are_read_back(self):
+    manifest = UploadManifest(self.path, max_entries=10)
+    manifest.put('kw/a.csv', 'a1')
+    manifest.save()
+
+    self.assertEqual(UploadManifest(self.path, max_entries=10).get('kw/a.csv'), 'a1')
+    self.assertIsNone(UploadManifest(self.path, max_entries=10).get('kw/b.csv'))
+
+  def test_save_merges_entries_saved_meanwhile(self):
+    first = UploadManifest(self.path, max_entries=10)
+    second = UploadManifest(self.path, max_entries=10)
+    first.put('kw/a.csv', 'a1')
+    second.put('kw/b.csv', 'b1')
+    first.save()
+    second.save()
+
+    with open(self.path) as f:
+      self.assertEqual(json.load(f), {'kw/a.csv': 'a1', 'kw/b.csv': 'b1'})
+
+  def test_oldest_entries_are_dropped_over_max_entries(self):
+    manifest = UploadManifest(self.path, max_entries=2)
+    for name in ['a', 'b', 'c']:
+      manifest.put(f'kw/{name}.csv', f'{name}1')
+    manifest.save()
+
+    # uploaded again, a moves after c
+    manifest.put('kw/a.csv', 'a2')
+    manifest.put('kw/d.csv', 'd1')
+    manifest.save()
+
+    with open(self.path) as f:
+      self.assertEqual(list(json.load(f).items()), [('kw/a.csv', 'a2'), ('kw/d.csv', 'd1')])
+
+  def test_parallel_processes_keep_every_entry(self):
+    processes = [
+      multiprocessing.get_context('fork').Process(target=save_entries, args=(self.path, worker, 25))
+      for worker in range(4)
+    ]
+    for process in processes:
+      process.start()
+    for process in processes:
+      process.join()
+
+    with open(self.path) as f:
+      self.assertEqual(len(json.load(f)), 100)
+    self.assertEqual([name for name in os.listdir(self.work_dir) if name.endswith('.tmp')], [])
+
+if __name__ == '__main__':
+  unittest.main()